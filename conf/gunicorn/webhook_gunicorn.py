@@ -0,0 +1,27 @@
+# gunicorn configuration for the webhook launcher, used as
+#   gunicorn -c /etc/skynet/webhook_gunicorn.py webhook_launcher.wsgi:application
+#
+# Several prefork workers handle webhooks in parallel, so one slow BOSS
+# or database call does not stall all others as it does with the single
+# threaded fcgi process.
+
+import multiprocessing
+
+bind = "127.0.0.1:9301"
+workers = min(multiprocessing.cpu_count() * 2, 8)
+worker_class = "sync"
+timeout = 60
+# workers are recycled now and then to bound memory growth
+max_requests = 5000
+
+# load the application and warm its caches once in the master, the
+# workers inherit them
+preload_app = True
+
+def when_ready(server):
+    from webhook_launcher.wsgi import warm_up
+    warm_up()
+
+def post_fork(server, worker):
+    from webhook_launcher.wsgi import after_fork
+    after_fork()
@@ -79,10 +79,12 @@ fi
 %files
 %defattr(-,root,root,-)
 %config(noreplace) %{_sysconfdir}/skynet/webhook.conf
+%config(noreplace) %{_sysconfdir}/skynet/webhook_gunicorn.py
 %{python_sitelib}/webhook_launcher
 %{python_sitelib}/*egg-info
 %{_datadir}/webhook_launcher
 %config(noreplace) %{svdir}/webhook.conf
+%config(noreplace) %{svdir}/webhook_dispatcher.conf
 %config(noreplace) %{svdir}/delete_webhook.conf
 %dir /etc/skynet
 %dir /etc/supervisor
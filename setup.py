@@ -39,13 +39,18 @@ setup(
     author = 'Islam Amer <pharon@gmail.com>',
     packages = ['webhook_launcher',
                 'webhook_launcher.app',
+                'webhook_launcher.app.management',
+                'webhook_launcher.app.management.commands',
                 ],    
     package_dir = {'webhook_launcher':'src/webhook_launcher',
                    'webhook_launcher.app':'src/webhook_launcher/app',
                    'webhook_launcher.app.migrations' : 'src/webhook_launcher/app/migrations',
+                   'webhook_launcher.app.management' : 'src/webhook_launcher/app/management',
+                   'webhook_launcher.app.management.commands' : 'src/webhook_launcher/app/management/commands',
                   },
     package_data = { 'webhook_launcher' : ['templates/admin/*.html',
-                                           'templates/app/*.html']
+                                           'templates/app/*.html'],
+                     'webhook_launcher.app' : ['replay/*.json']
                    },
     data_files = static_files,
 )
@@ -25,25 +25,50 @@
       Used to contact the right OBS instance.
    :ev.package (string):
       Package that was deleted
+   :ev.packages (list):
+      OPTIONAL Packages that were deleted, to delete the webhooks of many
+      packages of ev.project at once
    :ev.project (string):
       OBS project in which the package lived
-   
-   
+
+:term:`Workitem` params IN
+
+:Parameters:
+   :whole_project (Boolean):
+      OPTIONAL Delete the webhooks of all packages of ev.project, for
+      removed projects
+
 :term:`Workitem` fields OUT:
 
 :Returns:
    :result (Boolean):
       True if the everything went OK, False otherwise
+   :deleted_webhooks (integer):
+      Number of webhook mappings deleted
 
 """
 
 import os
-os.environ['DJANGO_SETTINGS_MODULE'] = 'webhook_launcher.settings'
+import time
+
+_loaded = time.time()
 
-from webhook_launcher.app.models import WebHookMapping
+# seconds a database connection is reused before it is reopened
+CONNECTION_MAX_AGE = 600
 
 class ParticipantHandler(object):
-    """ Participant class as defined by the SkyNET API """
+    """ Participant class as defined by the SkyNET API
+
+    Django is set up on the first workitem, so the participant registers
+    quickly. The database connection is kept between workitems, checked
+    before each one and reopened when it is older than
+    connection_max_age or failed.
+    """
+
+    def __init__(self):
+        self.django = None
+        self.connected = None
+        self.max_age = CONNECTION_MAX_AGE
 
     def handle_wi_control(self, ctrl):
         """ job control thread """
@@ -51,21 +76,85 @@ class ParticipantHandler(object):
 
     def handle_lifecycle_control(self, ctrl):
         """ participant control thread """
-        pass
+        if ctrl.message == "start":
+            if ctrl.config.has_option("delete_webhook", "connection_max_age"):
+                self.max_age = ctrl.config.getint("delete_webhook", "connection_max_age")
+            print "delete_webhook started in %.3fs" % (time.time() - _loaded)
+
+    def setup_django(self):
+        """ Import the webhook launcher, once """
+
+        if self.django is not None:
+            return self.django
+        started = time.time()
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webhook_launcher.settings')
+        from django import db
+        from django.db import transaction
+        from webhook_launcher.app.models import WebHookMapping
+        from webhook_launcher.app.querycount import count_queries
+        from webhook_launcher.app.utils import delete_mappings
+        self.django = { "db" : db,
+                        "transaction" : transaction,
+                        "WebHookMapping" : WebHookMapping,
+                        "count_queries" : count_queries,
+                        "delete_mappings" : delete_mappings }
+        print "Django set up in %.3fs" % (time.time() - started)
+        return self.django
+
+    def check_connection(self, db):
+        """ Close the connection if it is too old or doesn't answer, the
+            next query opens a new one
+        """
+
+        connection = db.connection
+        if connection.connection is not None:
+            if time.time() - self.connected > self.max_age:
+                connection.close()
+            else:
+                try:
+                    connection.cursor().execute("SELECT 1")
+                except db.DatabaseError, exc:
+                    print "Reconnecting to the database: %s" % exc
+                    connection.close()
+        if connection.connection is None:
+            self.connected = time.time()
 
     def handle_wi(self, wid):
         """ Workitem handling function """
         wid.result = False
 
         prj = wid.fields.ev.project
-        pkg = wid.fields.ev.package
+        pkgs = list(wid.fields.ev.packages or [])
+        if wid.fields.ev.package:
+            pkgs.append(wid.fields.ev.package)
+        whole_project = wid.params.whole_project
 
-        if not prj or not pkg:
+        if not prj or not (pkgs or whole_project):
            raise RuntimeError("Missing mandatory field or parameter: ev.package, ev.project")
 
-        mappings = WebHookMapping.objects.filter(project=prj, package=pkg)
-
-        for mapobj in mappings:
-            mapobj.delete()
-
+        started = time.time()
+        django = self.setup_django()
+        db = django["db"]
+        # DEBUG keeps every query of this long running process otherwise
+        db.reset_queries()
+        self.check_connection(db)
+        try:
+            with django["count_queries"]() as counted:
+                mappings = django["WebHookMapping"].objects.filter(project=prj)
+                if not whole_project:
+                    mappings = mappings.filter(package__in=pkgs)
+                summary = django["delete_mappings"](mappings.values_list('id', flat=True))
+            # end the transaction the lookup opened
+            django["transaction"].commit_unless_managed()
+        except Exception:
+            # don't reuse a connection in an unknown state
+            db.connection.close()
+            raise
+
+        print ("Deleted %s webhooks, %s last seen revisions and %s pending builds "
+               "of %s (%s packages) in %.1f ms: %s queries, %.1f ms SQL") % (
+            summary["mappings"], summary["revisions"], summary["pending_builds"],
+            prj, whole_project and "all" or len(pkgs), (time.time() - started) * 1000,
+            counted.count, counted.seconds * 1000)
+        wid.fields.deleted_webhooks = summary["mappings"]
         wid.result = True
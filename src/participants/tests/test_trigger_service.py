@@ -0,0 +1,191 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+""" trigger_service against a stub OBS, run from src/participants with
+
+  python -m unittest discover tests
+"""
+
+import os
+import sys
+import threading
+import unittest
+from StringIO import StringIO
+from urllib2 import HTTPError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import trigger_service
+except ImportError, exc:
+    trigger_service = None
+    MISSING = str(exc)
+
+class StubOBS(object):
+    """ Records the calls trigger_service makes to OBS """
+
+    apiurl = "https://api.stub.invalid"
+
+    def __init__(self, packages=(), services=None, failures=0):
+        self.packages = set(packages)
+        self.services = dict(services or {})
+        # setupService fails with 503 this many times
+        self.failures = failures
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _call(self, *call):
+        with self.lock:
+            self.calls.append(call)
+
+    def count(self, name):
+        return len([call for call in self.calls if call[0] == name])
+
+    def getPackageList(self, project):
+        self._call("getPackageList", project)
+        return list(self.packages)
+
+    def getCreatePackage(self, project, package):
+        self._call("getCreatePackage", project, package)
+        self.packages.add(package)
+        return StringIO("created")
+
+    def getFile(self, project, package, name):
+        self._call("getFile", project, package, name)
+        if package not in self.services:
+            raise HTTPError(self.apiurl, 404, "Not Found", {}, None)
+        return self.services[package]
+
+    def setupService(self, project, package, content):
+        self._call("setupService", project, package)
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise HTTPError(self.apiurl, 503, "Service Unavailable", {}, None)
+        self.services[package] = content
+
+class Fields(object):
+    """ Workitem fields or params, missing ones are None """
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def __getattr__(self, name):
+        return None
+
+class Workitem(object):
+
+    def __init__(self, fields=None, params=None):
+        self.fields = Fields(**(fields or {}))
+        self.params = Fields(**(params or {}))
+        self.result = None
+
+REPO = "https://github.com/example/repo.git"
+
+@unittest.skipIf(trigger_service is None, "boss and osc are needed: %s" % (
+    trigger_service is None and MISSING))
+class TriggerServiceTest(unittest.TestCase):
+
+    def handler(self, obs):
+        handler = trigger_service.ParticipantHandler()
+        handler.obs = obs
+        handler.retry_backoff = 0
+        handler.reruns = []
+        handler.run_service = lambda project, package: handler.reruns.append(package)
+        return handler
+
+    def service(self, revision="abc"):
+        return trigger_service.make_service({ "url" : REPO, "branch" : "master",
+                                              "revision" : revision })
+
+    def test_create(self):
+        obs = StubOBS()
+        handler = self.handler(obs)
+        self.assertEqual(handler.update_service("prj", "pkg", self.service()), "created")
+        self.assertEqual(obs.count("getCreatePackage"), 1)
+        self.assertEqual(obs.count("setupService"), 1)
+
+    def test_unchanged_not_written(self):
+        obs = StubOBS(packages=["pkg"], services={ "pkg" : self.service() })
+        handler = self.handler(obs)
+        self.assertEqual(handler.update_service("prj", "pkg", self.service()), "unchanged")
+        self.assertEqual(handler.update_service("prj", "pkg", self.service()), "unchanged (cached)")
+        self.assertEqual(obs.count("setupService"), 0)
+        # the second call is answered from the cache
+        self.assertEqual(obs.count("getFile"), 1)
+        self.assertEqual(handler.reruns, [])
+
+    def test_changed_written(self):
+        obs = StubOBS(packages=["pkg"], services={ "pkg" : self.service("old") })
+        handler = self.handler(obs)
+        self.assertEqual(handler.update_service("prj", "pkg", self.service()), "updated")
+        self.assertEqual(obs.services["pkg"], self.service())
+
+    def test_force_reruns_unchanged(self):
+        obs = StubOBS(packages=["pkg"], services={ "pkg" : self.service() })
+        handler = self.handler(obs)
+        self.assertEqual(handler.update_service("prj", "pkg", self.service(), force=True), "rerun")
+        self.assertEqual(handler.update_service("prj", "pkg", self.service(), force=True), "rerun")
+        self.assertEqual(handler.reruns, ["pkg", "pkg"])
+
+    def test_head_forces(self):
+        # a rebuild of HEAD has the same _service every time
+        obs = StubOBS(packages=["pkg"], services={ "pkg" : self.service("HEAD") })
+        handler = self.handler(obs)
+        wid = Workitem(fields={ "packages" : [{ "project" : "prj", "package" : "pkg",
+                                                "repourl" : REPO, "branch" : "master",
+                                                "revision" : "HEAD" }] })
+        handler.handle_batch(wid)
+        self.assertTrue(wid.result)
+        self.assertEqual(wid.fields.results[0]["done"], "rerun")
+
+    def test_retry_server_errors(self):
+        obs = StubOBS(failures=2)
+        handler = self.handler(obs)
+        # the package was created by the first attempt
+        self.assertEqual(handler.trigger("prj", "pkg", self.service()), "updated")
+        self.assertEqual(obs.count("setupService"), 3)
+        self.assertEqual(obs.services["pkg"], self.service())
+
+    def test_retries_exhausted(self):
+        obs = StubOBS(failures=10)
+        handler = self.handler(obs)
+        handler.retries = 1
+        self.assertRaises(HTTPError, handler.trigger, "prj", "pkg", self.service())
+        self.assertEqual(obs.count("setupService"), 2)
+
+    def test_batch(self):
+        obs = StubOBS(packages=["same"], services={ "same" : self.service() }, failures=1)
+        handler = self.handler(obs)
+        entries = [{ "project" : "prj", "package" : "pkg%s" % number, "repourl" : REPO,
+                     "branch" : "master", "revision" : "abc" } for number in range(10)]
+        entries.append({ "project" : "prj", "package" : "same", "repourl" : REPO,
+                         "branch" : "master", "revision" : "abc", "force" : True })
+        entries.append({ "project" : "prj", "package" : "broken" })
+        wid = Workitem(fields={ "packages" : entries })
+        handler.handle_batch(wid)
+        results = dict((result["package"], result) for result in wid.fields.results)
+        self.assertEqual(len(results), 12)
+        self.assertFalse(wid.result)
+        self.assertFalse(results["broken"]["result"])
+        self.assertEqual(results["same"]["done"], "rerun")
+        self.assertTrue(all(results["pkg%s" % number]["result"] for number in range(10)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -27,8 +27,15 @@
       Package name to be rebuilt
    :project (string):
       OBS project in which the package lives
-   
-   
+   :force (Boolean):
+      OPTIONAL Run the service even when _service is unchanged, set for
+      builds triggered by hand. A revision of HEAD always does
+   :packages (list):
+      OPTIONAL Retrigger many packages at once. Each entry is a dict with
+      project, package, repourl and optionally branch, revision, token,
+      debian, dumb and force. project, package and repourl of the
+      workitem are then not used
+
 :term:`Workitem` params IN
 
 :Parameters:
@@ -36,19 +43,39 @@
       Package name to be rebuilt, overrides the package field
    :project (string):
       OBS project in which the package lives, overrides the project field
+   :force (Boolean):
+      OPTIONAL Same as the force field
 
 :term:`Workitem` fields OUT:
 
 :Returns:
    :result (Boolean):
       True if the everything went OK, False otherwise
+   :results (list):
+      For packages workitems, one dict per entry with project, package,
+      result and either done or error
 
 """
 
 from boss.obs import BuildServiceParticipant
-import osc
+import osc.core
+import hashlib
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from urllib2 import HTTPError
 from urlparse import urlparse
 
+# seconds the package lists and pushed _service digests are trusted
+CACHE_TTL = 300
+# packages of a batch handled at the same time, and at most this many
+# calls to the same OBS at once
+BATCH_WORKERS = 8
+OBS_CONCURRENCY = 4
+# OBS 5xx responses are retried after retry_backoff seconds, doubling
+RETRIES = 3
+RETRY_BACKOFF = 2
+
 tar_git_service = """
 <services>
   <service name="tar_git">
@@ -90,8 +117,91 @@ def find_service_repo(url):
     
     return None, None
 
+def make_service(params):
+    """ _service content for a dict with url, branch, revision and
+        optionally token, debian and dumb
+    """
+
+    params = dict(params)
+    params["service"], params["repo"] = find_service_repo(params["url"])
+    for name in ("token", "debian", "dumb"):
+        params.setdefault(name, "")
+
+    if "branch" in params and params["branch"].startswith("pkg-"):
+        if not params["service"] or not params["repo"]:
+            raise RuntimeError("Service/Repo not found in repourl %s " % params["url"])
+        return git_pkg_service % params
+    return tar_git_service % params
+
+class ServiceCache(object):
+    """ Packages known to exist per OBS project, and the digest of the
+        _service last pushed per package, each trusted for ttl seconds
+    """
+
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.packages = {}
+        self.services = {}
+
+    def _fresh(self, entry):
+        return entry is not None and time.time() - entry[0] < self.ttl
+
+    def package_list(self, apiurl, project, fetch):
+        """ Packages of project, from fetch() when not cached """
+
+        key = (apiurl, project)
+        with self.lock:
+            entry = self.packages.get(key)
+        if self._fresh(entry):
+            return entry[1]
+        packages = set(fetch())
+        with self.lock:
+            self.packages[key] = (time.time(), packages)
+        return packages
+
+    def add_package(self, apiurl, project, package):
+        with self.lock:
+            entry = self.packages.get((apiurl, project))
+            if entry is not None:
+                entry[1].add(package)
+
+    def pushed(self, apiurl, project, package):
+        """ Digest of the _service last pushed, None if unknown """
+
+        with self.lock:
+            entry = self.services.get((apiurl, project, package))
+        if self._fresh(entry):
+            return entry[1]
+        return None
+
+    def push(self, apiurl, project, package, digest):
+        with self.lock:
+            self.services[(apiurl, project, package)] = (time.time(), digest)
+
+    def forget(self, apiurl, project, package):
+        with self.lock:
+            self.packages.pop((apiurl, project), None)
+            self.services.pop((apiurl, project, package), None)
+
 class ParticipantHandler(BuildServiceParticipant):
-    """ Participant class as defined by the SkyNET API """
+    """ Participant class as defined by the SkyNET API
+
+    Writing _service makes OBS run the source service, so it is only
+    written when it differs from what the package has. Package lists and
+    the digests of pushed _service files are cached for cache_ttl
+    seconds; the live _service is only read on a cache miss.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ParticipantHandler, self).__init__(*args, **kwargs)
+        self.cache = ServiceCache()
+        self.batch_workers = BATCH_WORKERS
+        self.obs_concurrency = OBS_CONCURRENCY
+        self.retries = RETRIES
+        self.retry_backoff = RETRY_BACKOFF
+        self.lock = threading.Lock()
+        self.slots = {}
 
     def handle_wi_control(self, ctrl):
         """ job control thread """
@@ -100,7 +210,130 @@ class ParticipantHandler(BuildServiceParticipant):
     @BuildServiceParticipant.get_oscrc
     def handle_lifecycle_control(self, ctrl):
         """ participant control thread """
-        pass
+        if ctrl.message == "start":
+            config = ctrl.config
+            if config.has_option("trigger_service", "cache_ttl"):
+                self.cache.ttl = config.getint("trigger_service", "cache_ttl")
+            if config.has_option("trigger_service", "batch_workers"):
+                self.batch_workers = config.getint("trigger_service", "batch_workers")
+            if config.has_option("trigger_service", "obs_concurrency"):
+                self.obs_concurrency = config.getint("trigger_service", "obs_concurrency")
+            if config.has_option("trigger_service", "retries"):
+                self.retries = config.getint("trigger_service", "retries")
+            if config.has_option("trigger_service", "retry_backoff"):
+                self.retry_backoff = config.getfloat("trigger_service", "retry_backoff")
+
+    def _slot(self, apiurl):
+        with self.lock:
+            if apiurl not in self.slots:
+                self.slots[apiurl] = threading.BoundedSemaphore(self.obs_concurrency)
+            return self.slots[apiurl]
+
+    def trigger(self, project, package, content, force=False):
+        """ update_service within the concurrency limit of the OBS,
+            retrying server errors with backoff
+        """
+
+        delay = self.retry_backoff
+        for attempt in range(self.retries + 1):
+            try:
+                with self._slot(getattr(self.obs, "apiurl", None)):
+                    return self.update_service(project, package, content, force)
+            except HTTPError, exc:
+                if exc.code < 500 or attempt == self.retries:
+                    raise
+                print "%s/%s: OBS returned %s, retrying in %ss" % (project, package, exc.code, delay)
+                time.sleep(delay)
+                delay *= 2
+
+    def run_service(self, project, package):
+        """ Make OBS run the source service of a package again """
+
+        osc.core.runservice(self.obs.apiurl, project, package)
+
+    def update_service(self, project, package, content, force=False):
+        """ Create the package if needed and write its _service unless it
+            already has this content. With force the service is run again
+            when the content is unchanged. Returns what was done.
+        """
+
+        apiurl = getattr(self.obs, "apiurl", None)
+        digest = hashlib.sha1(content).hexdigest()
+        if self.cache.pushed(apiurl, project, package) == digest:
+            if force:
+                self.run_service(project, package)
+                return "rerun"
+            return "unchanged (cached)"
+
+        try:
+            packages = self.cache.package_list(apiurl, project,
+                                               lambda: self.obs.getPackageList(project))
+            if package not in packages:
+                x = self.obs.getCreatePackage(str(project), str(package))
+                print x.read()
+                self.cache.add_package(apiurl, project, package)
+                done = "created"
+            else:
+                try:
+                    live = self.obs.getFile(project, package, "_service")
+                except HTTPError, exc:
+                    if exc.code != 404:
+                        raise
+                    live = None
+                if live is not None and hashlib.sha1(live).hexdigest() == digest:
+                    self.cache.push(apiurl, project, package, digest)
+                    if force:
+                        self.run_service(project, package)
+                        return "rerun"
+                    return "unchanged"
+                done = "updated"
+
+            self.obs.setupService(project, package, content)
+        except Exception:
+            # the package may have been removed or changed behind our back
+            self.cache.forget(apiurl, project, package)
+            raise
+        self.cache.push(apiurl, project, package, digest)
+        return done
+
+    def handle_batch(self, wid):
+        """ Retrigger the packages listed in the workitem on a thread pool """
+
+        entries = wid.fields.packages
+
+        def run(entry):
+            project = entry.get("project")
+            package = entry.get("package")
+            result = { "project" : project, "package" : package, "result" : False }
+            try:
+                if not project or not package or not entry.get("repourl"):
+                    raise RuntimeError("Missing mandatory project, package or repourl")
+                params = { "url" : entry["repourl"] }
+                for name in ("branch", "revision", "token", "debian", "dumb"):
+                    if entry.get(name):
+                        params[name] = entry[name]
+                force = bool(entry.get("force")) or params.get("revision") == "HEAD"
+                result["done"] = self.trigger(project, package, make_service(params), force)
+                result["result"] = True
+            except Exception, exc:
+                result["error"] = str(exc)
+            return result
+
+        started = time.time()
+        pool = ThreadPool(max(1, min(self.batch_workers, len(entries))))
+        try:
+            results = pool.map(run, entries)
+        finally:
+            pool.close()
+            pool.join()
+
+        failed = [result for result in results if not result["result"]]
+        print "Retriggered %s packages, %s failed, in %.1fs" % (
+            len(results), len(failed), time.time() - started)
+        for result in failed:
+            print "%(project)s/%(package)s: %(error)s" % result
+        wid.fields.results = results
+        wid.result = not failed
 
     @BuildServiceParticipant.setup_obs
     def handle_wi(self, wid):
@@ -109,6 +342,9 @@ class ParticipantHandler(BuildServiceParticipant):
         f = wid.fields
         p = wid.params
 
+        if f.packages:
+            return self.handle_batch(wid)
+
         project = None
         package = None
 
@@ -134,8 +370,6 @@ class ParticipantHandler(BuildServiceParticipant):
         if p.repourl:
             params["url"] = p.repourl
 
-        params["service"], params["repo"] = find_service_repo(params["url"])
-            
         if f.branch:
             params["branch"] = f.branch
         if p.branch:
@@ -144,9 +378,6 @@ class ParticipantHandler(BuildServiceParticipant):
             params["revision"] = f.revision
         if p.revision:
             params["revision"] = p.revision
-        params["token"] = ""
-        params["debian"] = ""
-        params["dumb"] = ""
         if f.token:
             params["token"] = f.token
         if p.token:
@@ -161,17 +392,11 @@ class ParticipantHandler(BuildServiceParticipant):
         if f.dumb:
             params["dumb"] = f.dumb
 
-        if "branch" in params and params["branch"].startswith("pkg-"):
-            if not "service" in params or not "repo" in params:
-                raise RuntimeError("Service/Repo not found in repourl %s " % p.repourl)
-            service = git_pkg_service
-        else:
-            service = tar_git_service
-        
-        if self.obs.isNewPackage(project, package):
-            x = self.obs.getCreatePackage(str(project), str(package))
-            print x.read()
-        
-        self.obs.setupService(project, package, service % params)
+        # a rebuild of HEAD has the same _service as the previous one
+        force = bool(f.force or p.force) or params.get("revision") == "HEAD"
+
+        started = time.time()
+        done = self.trigger(project, package, make_service(params), force)
+        print "%s/%s: _service %s in %.1fs" % (project, package, done, time.time() - started)
 
         wid.result = True
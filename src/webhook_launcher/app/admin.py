@@ -23,8 +23,8 @@ from django.contrib import admin, messages
 from django.forms import TextInput
 from django.core.urlresolvers import reverse
 
-from webhook_launcher.app.models import LastSeenRevision, WebHookMapping, BuildService
-from webhook_launcher.app.utils import rev_or_head, handle_tag
+from webhook_launcher.app.models import LastSeenRevision, WebHookMapping, BuildService, QueuedEvent, PendingBuild, BuildBatch
+from webhook_launcher.app.batches import queue_batch, dispatch_batch, requeue_stale_builds
 
 class LastSeenRevisionInline(admin.StackedInline):
     model = LastSeenRevision 
@@ -62,6 +62,7 @@ class WebHookMappingAdmin(admin.ModelAdmin):
             pk_value = obj._get_pk_val()
 
             self.trigger_build(request, [obj])
+            # stay on the mapping, the message links to the progress
             return HttpResponseRedirect(reverse('admin:%s_%s_change' %
                                         (opts.app_label, module_name),
                                         args=(pk_value,),
@@ -70,10 +71,13 @@ class WebHookMappingAdmin(admin.ModelAdmin):
             return super(WebHookMappingAdmin, self).response_change(request, obj)
 
     def trigger_build(self, request, mappings):
-        for mapobj in mappings:
-            handle_tag(mapobj, request.user, {})
-            msg = 'Build triggered for %(rev)s @ "%(obj)s" .' % {'obj': mapobj, 'rev': rev_or_head(mapobj)}
-            self.message_user(request, msg)
+        batch = queue_batch(mappings, request.user)
+        dispatch_batch(batch)
+        progress = reverse('build_batch', args=(batch.pk,))
+        # messages are escaped, so the link is spelled out
+        self.message_user(request, "%s build(s) queued, follow their progress on %s" %
+                                   (batch.total, request.build_absolute_uri(progress)))
+        return HttpResponseRedirect(progress)
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "user":
@@ -98,6 +102,41 @@ class BuildServiceAdmin(admin.ModelAdmin):
 class LastSeenRevisionAdmin(admin.ModelAdmin):
     pass
 
+class PendingBuildAdmin(admin.ModelAdmin):
+    list_display = ( 'mapping', 'revision', 'pending', 'due', 'superseded', 'launched', 'last_launched' )
+    list_filter = ( 'last_launched', )
+    search_fields = ( 'mapping__repourl', 'mapping__project', 'mapping__package', 'revision' )
+    readonly_fields = ( 'superseded', 'launched', 'last_launched' )
+
+class BuildBatchAdmin(admin.ModelAdmin):
+    list_display = ( 'id', 'user', 'created', 'total', 'progress' )
+    list_filter = ( 'user', )
+    readonly_fields = ( 'user', 'created', 'total' )
+    actions = ['resume']
+
+    def progress(self, obj):
+        return '<a href="%s">progress</a>' % reverse('build_batch', args=(obj.pk,))
+    progress.allow_tags = True
+
+    def resume(self, request, queryset):
+        for batch in queryset:
+            requeue_stale_builds(batch)
+            dispatch_batch(batch)
+        self.message_user(request, "%s batch(es) resumed." % len(queryset))
+
+class QueuedEventAdmin(admin.ModelAdmin):
+    list_display = ( 'id', 'provider', 'repourl', 'state', 'received', 'claimed', 'attempts' )
+    list_filter = ( 'state', 'provider' )
+    search_fields = ( 'repourl', )
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        count = queryset.update(state=QueuedEvent.NEW, claimed=None)
+        self.message_user(request, "%s event(s) queued again." % count)
+
 admin.site.register(WebHookMapping, WebHookMappingAdmin)
 admin.site.register(BuildService, BuildServiceAdmin)
 admin.site.register(LastSeenRevision, LastSeenRevisionAdmin)
+admin.site.register(QueuedEvent, QueuedEventAdmin)
+admin.site.register(PendingBuild, PendingBuildAdmin)
+admin.site.register(BuildBatch, BuildBatchAdmin)
@@ -0,0 +1,240 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" builds triggered in bulk from the admin, launched in the background """
+
+import datetime
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from webhook_launcher.app.models import BuildBatch, BatchedBuild
+from webhook_launcher.app.utils import handle_tag, rev_or_head
+
+_watcher_lock = threading.Lock()
+_watcher = None
+
+# builds claimed at a time, the rate limit permitting
+BATCH_CHUNK = 20
+
+# seconds between checks for batches nobody launches any more
+BATCH_WATCH_INTERVAL = 60
+
+def queue_batch(mappings, user):
+    """ Store a build of each of mappings as one BuildBatch, without
+        launching anything
+    """
+
+    mapping_ids = sorted(set(mapobj.pk for mapobj in mappings))
+    # committed right away, the builds are launched from another thread
+    with transaction.commit_on_success():
+        batch = BuildBatch.objects.create(user=user, total=len(mapping_ids))
+        BatchedBuild.objects.bulk_create([BatchedBuild(batch=batch, mapping_id=mapping_id)
+                                          for mapping_id in mapping_ids])
+    return batch
+
+def claim_batched_builds(limit, batch=None):
+    """ Atomically mark up to limit pending builds as launching, oldest
+        first, returns their ids
+    """
+
+    candidates = BatchedBuild.objects.filter(state=BatchedBuild.NEW)
+    if batch is not None:
+        candidates = candidates.filter(batch=batch)
+    claimed = []
+    for pk in candidates.order_by('id').values_list('id', flat=True)[:limit]:
+        if BatchedBuild.objects.filter(pk=pk, state=BatchedBuild.NEW).update(
+                state=BatchedBuild.RUNNING, claimed=datetime.datetime.now()):
+            claimed.append(pk)
+    return claimed
+
+def launch_batched_builds(limit, batch=None):
+    """ Launch up to limit pending builds, of batch or of any batch,
+        returns how many were claimed
+    """
+
+    pks = claim_batched_builds(limit, batch)
+    if not pks:
+        return 0
+
+    builds = BatchedBuild.objects.filter(pk__in=pks).order_by('id').select_related(
+        'batch__user', 'mapping__obs').prefetch_related('mapping__lastseenrevision_set')
+    for build in builds:
+        mapobj = build.mapping
+        try:
+            # triggered by hand, so rebuild even an unchanged revision
+            handle_tag(mapobj, build.batch.user, {}, debounce=False, force=True)
+        except Exception:
+            traceback.print_exc()
+            BatchedBuild.objects.filter(pk=build.pk).update(
+                state=BatchedBuild.FAILED, error=traceback.format_exc())
+            continue
+        BatchedBuild.objects.filter(pk=build.pk).update(
+            state=BatchedBuild.LAUNCHED, revision=rev_or_head(mapobj))
+    return len(pks)
+
+def requeue_stale_builds(batch=None):
+    """ Return builds claimed by a process that went away """
+
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=settings.DISPATCHER_STALE_AFTER)
+    stale = BatchedBuild.objects.filter(state=BatchedBuild.RUNNING, claimed__lt=cutoff)
+    if batch is not None:
+        stale = stale.filter(batch=batch)
+    count = stale.update(state=BatchedBuild.NEW)
+    if count:
+        print "requeued %s stale batched build(s)" % count
+    return count
+
+def orphaned_batches():
+    """ Batches with pending builds that no process claimed any of for
+        stale_after seconds, and that no thread of this process runs
+    """
+
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=settings.DISPATCHER_STALE_AFTER)
+    pending = list(BuildBatch.objects.filter(batchedbuild__state=BatchedBuild.NEW,
+                                             created__lt=cutoff).distinct())
+    if not pending:
+        return []
+    active = set(BatchedBuild.objects.filter(batch__in=pending, claimed__gte=cutoff)
+                 .values_list('batch_id', flat=True))
+    running = set(thread.name for thread in threading.enumerate())
+    return [batch for batch in pending
+            if batch.pk not in active and "batch-%s" % batch.pk not in running]
+
+def resume_batches():
+    """ Requeue the builds of runners that went away, eg. with a recycled
+        worker, and start a runner for each batch left without one
+    """
+
+    requeue_stale_builds()
+    batches = orphaned_batches()
+    for batch in batches:
+        print "resuming batch %s" % batch.pk
+        BatchRunner(batch).start()
+    return len(batches)
+
+class Pacer(object):
+    """ Token bucket allowing rate launches per second on average and at
+        most one second worth at once. A rate of 0 means no limit.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = 1.0
+        self.last = time.time()
+
+    def allowance(self, most):
+        """ How many of most launches may go right now """
+
+        if not self.rate:
+            return most
+        now = time.time()
+        self.tokens = min(self.tokens + (now - self.last) * self.rate, max(self.rate, 1.0))
+        self.last = now
+        return min(int(self.tokens), most)
+
+    def spend(self, count):
+        if self.rate:
+            self.tokens -= count
+
+    def delay(self):
+        """ Seconds until the next launch is allowed """
+
+        if not self.rate:
+            return 0
+        return max((1 - self.tokens) / self.rate, 0)
+
+class BatchRunner(threading.Thread):
+    """ Launches the builds of one batch from the process that queued it,
+        for deployments that don't run webhook_dispatcher
+    """
+
+    def __init__(self, batch, rate=None):
+        super(BatchRunner, self).__init__(name="batch-%s" % batch.pk)
+        self.daemon = True
+        self.batch = batch
+        if rate is None:
+            rate = settings.BATCH_BUILD_RATE
+        self.pacer = Pacer(rate)
+
+    def run(self):
+        started = time.time()
+        launched = 0
+        try:
+            while True:
+                allowed = self.pacer.allowance(BATCH_CHUNK)
+                if not allowed:
+                    time.sleep(self.pacer.delay())
+                    continue
+                claimed = launch_batched_builds(allowed, self.batch)
+                if not claimed:
+                    break
+                self.pacer.spend(claimed)
+                launched += claimed
+        except Exception:
+            traceback.print_exc()
+        finally:
+            connection.close()
+        print "batch %s: %s build(s) handled in %.1fs" % (self.batch.pk, launched,
+                                                          time.time() - started)
+
+class BatchWatcher(threading.Thread):
+    """ Resumes orphaned batches now and then, in processes that launch
+        batches themselves
+    """
+
+    def __init__(self, interval=BATCH_WATCH_INTERVAL):
+        super(BatchWatcher, self).__init__(name="batch-watcher")
+        self.daemon = True
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                resume_batches()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                connection.close()
+
+def start_batch_watcher():
+    """ Start the BatchWatcher of this process, unless webhook_dispatcher
+        launches the batches
+    """
+
+    global _watcher
+    if settings.ASYNC_DISPATCH:
+        return
+    with _watcher_lock:
+        if _watcher is None or not _watcher.is_alive():
+            _watcher = BatchWatcher()
+            _watcher.start()
+
+def dispatch_batch(batch):
+    """ Launch batch in the background: webhook_dispatcher picks it up
+        when ingestion is asynchronous, otherwise a thread of this process
+        does
+    """
+
+    if not settings.ASYNC_DISPATCH:
+        BatchRunner(batch).start()
+        start_batch_watcher()
@@ -0,0 +1,276 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" micro benchmarks of the webhook hot paths
+
+Each benchmark runs a few sizes of input, and where the code replaced an
+older approach it times that approach too. Run them with
+
+  django-admin run_benchmarks --settings=webhook_launcher.settings [NAME ...]
+"""
+
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from django.contrib.auth.models import User
+from south.db import db
+
+from webhook_launcher.ipfilter import NetworkMatcher, parse_address, parse_network
+from webhook_launcher.app import loadtest
+from webhook_launcher.app.launcher_pool import LauncherPool
+from webhook_launcher.app.models import BuildService, WebHookMapping
+from webhook_launcher.app.utils import tagged_tips
+
+# name -> function yielding (case, variant, operations per second)
+BENCHMARKS = OrderedDict()
+
+def benchmark(func):
+    BENCHMARKS[func.__name__.replace("_", "-")] = func
+    return func
+
+def rate(func, operations=1, seconds=0.5):
+    """ Operations per second of func, each call doing operations of them,
+        called for about seconds
+    """
+
+    calls = 0
+    started = time.time()
+    elapsed = 0
+    while elapsed < seconds:
+        func()
+        calls += 1
+        elapsed = time.time() - started
+    return calls * operations / elapsed
+
+def _random_networks(rnd, count):
+    networks = ["%d.%d.%d.0/24" % (rnd.randint(1, 223), rnd.randint(0, 255), rnd.randint(0, 255))
+                for i in range(count // 2)]
+    networks.extend("2620:%x:%x::/48" % (rnd.randint(0, 0xffff), rnd.randint(0, 0xffff))
+                    for i in range(count - len(networks)))
+    return networks
+
+@benchmark
+def ipfilter(seconds):
+    """ POST ip filter lookups, half of them hits: the compiled matcher
+        and a linear scan over the same networks
+    """
+
+    rnd = random.Random(0)
+    for size in (10, 100, 1000, 10000):
+        networks = _random_networks(rnd, size)
+        matcher = NetworkMatcher(networks)
+        parsed = [parse_network(cidr) for cidr in networks]
+        addresses = []
+        for cidr in rnd.sample(networks, min(50, size)):
+            addresses.append(cidr.replace("0/24", "7").replace("::/48", "::7"))
+            addresses.append("%d.%d.%d.%d" % tuple(rnd.randint(1, 223) for i in range(4)))
+
+        def compiled():
+            for ip in addresses:
+                ip in matcher
+
+        def linear():
+            for ip in addresses:
+                family, value, bits = parse_address(ip)
+                for net_family, first, last in parsed:
+                    if net_family == family and first <= value <= last:
+                        break
+
+        case = "%s networks" % size
+        yield case, "compiled", rate(compiled, len(addresses), seconds)
+        yield case, "linear", rate(linear, len(addresses), seconds)
+
+# round trips of opening an AMQP connection and channel: start, tune,
+# open and channel open
+HANDSHAKE_ROUND_TRIPS = 4
+
+class StandInBroker(threading.Thread):
+    """ Local TCP server answering each line it gets, standing in for the
+        AMQP broker
+    """
+
+    def __init__(self):
+        super(StandInBroker, self).__init__(name="stand-in-broker")
+        self.daemon = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(64)
+        self.address = "127.0.0.1:%s" % self.sock.getsockname()[1]
+
+    def run(self):
+        while True:
+            conn, peer = self.sock.accept()
+            thread = threading.Thread(target=self.serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def serve(self, conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for line in conn.makefile():
+            conn.sendall("ok\n")
+        conn.close()
+
+class StandInLauncher(object):
+    """ Launcher talking to a StandInBroker: connecting costs the round
+        trips of an AMQP handshake, a launch one more
+    """
+
+    def __init__(self, amqp_host=None, amqp_user=None, amqp_pass=None,
+                 amqp_vhost=None):
+        host, port = amqp_host.split(":")
+        self.conn = socket.create_connection((host, int(port)))
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.replies = self.conn.makefile()
+        self.is_open = True
+        self.chan = self
+        for i in range(HANDSHAKE_ROUND_TRIPS):
+            self._round_trip("handshake")
+
+    def _round_trip(self, line):
+        self.conn.sendall(line + "\n")
+        self.replies.readline()
+
+    def launch(self, process, fields):
+        self._round_trip("launch")
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.replies.close()
+            self.conn.close()
+
+@benchmark
+def launcher_pool(seconds):
+    """ Launches against a local AMQP stand-in: through the LauncherPool,
+        and with a new connection per launch as before the pool
+    """
+
+    broker = StandInBroker()
+    broker.start()
+    pool = LauncherPool(launcher_class=StandInLauncher)
+
+    def pooled():
+        pool.launch(broker.address, "boss", "boss", "boss", "process", {})
+
+    def unpooled():
+        launcher = StandInLauncher(amqp_host=broker.address)
+        try:
+            launcher.launch("process", {})
+        finally:
+            launcher.close()
+
+    def threaded(launch, threads, launches=20):
+        def run():
+            workers = [threading.Thread(target=lambda: [launch() for i in range(launches)])
+                       for i in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        return run
+
+    for threads in (1, 4):
+        case = "%s thread(s)" % threads
+        yield case, "pooled", rate(threaded(pooled, threads), threads * 20, seconds)
+        yield case, "unpooled", rate(threaded(unpooled, threads), threads * 20, seconds)
+    pool.close()
+
+def branches_tags_response(rnd, branches, tags):
+    """ Synthetic bitbucket branches-tags response, with the head of every
+        other branch tagged
+    """
+
+    changesets = ["%040x" % rnd.getrandbits(160) for i in range(tags)]
+    heads = [rnd.choice(changesets) if number % 2 else "%040x" % rnd.getrandbits(160)
+             for number in range(branches)]
+    return { "branches" : [{ "name" : "branch-%s" % number, "changeset" : head }
+                           for number, head in enumerate(heads)],
+             "tags" : [{ "name" : "tag-%s" % number, "changeset" : changeset }
+                       for number, changeset in enumerate(changesets)] }
+
+@benchmark
+def tag_matching(seconds):
+    """ Finding the tagged branch heads of a tags only bitbucket push: a
+        set of tagged changesets against comparing every branch with
+        every tag
+    """
+
+    rnd = random.Random(0)
+    for tags in (100, 1000, 10000):
+        response = branches_tags_response(rnd, 50, tags)
+
+        def nested():
+            tips = {}
+            for branch in response['branches']:
+                for tag in response['tags']:
+                    if tag['changeset'] == branch['changeset']:
+                        tips[branch['name']] = branch['changeset']
+            return tips
+
+        assert nested() == tagged_tips(response)
+        case = "50 branches, %s tags" % tags
+        yield case, "set", rate(lambda: tagged_tips(response), 1, seconds)
+        yield case, "nested", rate(nested, 1, seconds)
+
+@benchmark
+def mapping_lookup(seconds, repos=5000, branches=10):
+    """ Mapping queries of placeholder creation and of the delete_webhook
+        participant on 50000 mappings, with the indexes of migration 0008
+        and without them
+    """
+
+    with loadtest.test_database():
+        loadtest.create_fixtures([], 0)
+        user = User.objects.get(pk=1)
+        obs = BuildService.objects.get()
+        mappings = []
+        for repo in range(repos):
+            for branch in range(branches):
+                mappings.append(WebHookMapping(
+                    repourl="https://github.com/example/repo-%05d.git" % repo,
+                    branch="branch-%s" % branch, project="project:%05d" % repo,
+                    package="package-%s" % branch, user=user, obs=obs))
+                if len(mappings) == 500:
+                    WebHookMapping.objects.bulk_create(mappings)
+                    mappings = []
+        WebHookMapping.objects.bulk_create(mappings)
+
+        rnd = random.Random(0)
+        keys = [(rnd.randrange(repos), rnd.randrange(branches)) for i in range(20)]
+
+        def by_branch():
+            for repo, branch in keys:
+                list(WebHookMapping.objects.filter(
+                    repourl="https://github.com/example/repo-%05d.git" % repo,
+                    branch="branch-%s" % branch))
+
+        def by_package():
+            for repo, branch in keys:
+                list(WebHookMapping.objects.filter(project="project:%05d" % repo,
+                                                   package="package-%s" % branch))
+
+        case = "%s mappings" % (repos * branches)
+        yield case + ", repourl branch", "indexed", rate(by_branch, len(keys), seconds)
+        yield case + ", project package", "indexed", rate(by_package, len(keys), seconds)
+        db.delete_index('app_webhookmapping', ['repourl', 'branch'])
+        db.delete_index('app_webhookmapping', ['project', 'package'])
+        yield case + ", repourl branch", "no index", rate(by_branch, len(keys), seconds)
+        yield case + ", project package", "no index", rate(by_package, len(keys), seconds)
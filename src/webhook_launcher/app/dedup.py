@@ -0,0 +1,115 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" recognition of redelivered webhooks """
+
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from webhook_launcher.app.models import Delivery
+
+# headers carrying a unique id per delivery, redeliveries keep it
+DELIVERY_HEADERS = ("HTTP_X_GITHUB_DELIVERY", "HTTP_X_REQUEST_UUID",
+                    "HTTP_X_GITLAB_EVENT_UUID")
+
+def delivery_key(request):
+    """ Id of the delivery, None when the provider sent none
+
+    Payloads are not keyed by their content: two pushes of nothing but
+    tags by the same user have identical bodies.
+    """
+
+    for header in DELIVERY_HEADERS:
+        if request.META.get(header):
+            return "%s:%s" % (header[7:].lower(), request.META[header])
+    return None
+
+class DeliveryCache(object):
+    """ Remembers claimed deliveries for ttl seconds
+
+    A delivery is claimed before it is handled, so a retry arriving while
+    the first attempt is still running is recognised too, and released
+    again when handling it failed. The in process tier is an LRU of at
+    most size keys. With use_db a claim also inserts into the Delivery
+    table, whose unique key makes several webhook processes agree on who
+    handles a delivery.
+    """
+
+    def __init__(self, size=10000, ttl=3600, use_db=False):
+        self.size = size
+        self.ttl = ttl
+        self.use_db = use_db
+        self.lock = threading.Lock()
+        self.keys = OrderedDict()
+        self.writes = 0
+
+    def _local_claim(self, key, now):
+        with self.lock:
+            stamp = self.keys.pop(key, None)
+            if stamp is not None and now - stamp <= self.ttl:
+                # most recently used goes last
+                self.keys[key] = stamp
+                return False
+            self.keys[key] = now
+            while len(self.keys) > self.size:
+                self.keys.popitem(last=False)
+            return True
+
+    def _db_claim(self, key):
+        now = datetime.datetime.now()
+        cutoff = now - datetime.timedelta(seconds=self.ttl)
+        try:
+            Delivery.objects.create(key=key)
+        except IntegrityError:
+            transaction.rollback_unless_managed()
+            # a row older than the ttl that wasn't pruned yet can be taken over
+            if not Delivery.objects.filter(key=key, received__lt=cutoff).update(received=now):
+                return False
+        self.writes += 1
+        if self.writes % 100 == 0:
+            Delivery.objects.filter(received__lt=cutoff).delete()
+        return True
+
+    def claim(self, key):
+        """ True when the delivery is new and now ours to handle, False
+            when it was claimed within the last ttl seconds
+        """
+
+        if not self._local_claim(key, time.time()):
+            return False
+        if self.use_db and not self._db_claim(key):
+            return False
+        return True
+
+    def release(self, key):
+        """ Give up a claim when handling the delivery failed, so a retry
+            goes through
+        """
+
+        with self.lock:
+            self.keys.pop(key, None)
+        if self.use_db:
+            Delivery.objects.filter(key=key).delete()
+
+deliveries = DeliveryCache(size=settings.DEDUP_SIZE, ttl=settings.DEDUP_TTL,
+                           use_db=settings.DEDUP_DB)
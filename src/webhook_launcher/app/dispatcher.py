@@ -0,0 +1,260 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" background dispatcher for spooled webhook events """
+
+import datetime
+import threading
+import time
+import traceback
+import Queue
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection
+from django.utils import simplejson
+
+from webhook_launcher.app.models import QueuedEvent
+from webhook_launcher.app import eventlog
+from webhook_launcher.app.utils import WEBHOOK_LAUNCHERS, coalesced_launches, launch_due_builds
+from webhook_launcher.app.batches import BATCH_CHUNK, BATCH_WATCH_INTERVAL, Pacer, launch_batched_builds, requeue_stale_builds
+
+def batch_key(provider, repourl, data):
+    """ Key grouping events that belong to the same push
+
+    github sends one POST per ref even when the refs were pushed
+    together, they share the repository and pusher.
+    """
+
+    if provider == "github":
+        pusher = data.get('pusher') or {}
+        who = pusher.get('name') or data.get('user_name') or data.get('after', '')
+    else:
+        who = data.get('user', '')
+    return ("%s %s %s" % (provider, repourl, who))[:250]
+
+def spool_event(provider, repourl, payload, data):
+    """ Store a validated webhook payload for later dispatch
+
+    :param provider: key of WEBHOOK_LAUNCHERS handling the payload
+    :param repourl: canonical repository url
+    :param payload: raw JSON payload as received
+    :param data: decoded payload
+    """
+
+    return QueuedEvent.objects.create(provider=provider, repourl=repourl,
+                                      payload=payload,
+                                      batch_key=batch_key(provider, repourl, data))
+
+def run_events(events):
+    """ Launch a group of claimed events belonging to the same push
+
+    Notifies and builds of the whole group are merged before launching.
+    An event that raises is marked failed on its own: the revisions the
+    others recorded are committed already, so their launches must go out
+    now, a retry would find them seen and skip them. Events are dropped
+    from the spool on success. Returns the number of failed events.
+    """
+
+    eventlog.begin(provider=events[0].provider, events=[event.id for event in events])
+    errors = {}
+    try:
+        with coalesced_launches():
+            for event in events:
+                func = WEBHOOK_LAUNCHERS[event.provider]
+                try:
+                    func(event.repourl, simplejson.loads(event.payload))
+                except Exception:
+                    # what it collected before raising is for revisions it
+                    # recorded, so that is launched with the rest
+                    print "event %s failed" % event.id
+                    traceback.print_exc()
+                    eventlog.add("failed", event.id)
+                    errors[event.pk] = traceback.format_exc()
+    except Exception:
+        # launching failed
+        print "event(s) %s failed" % ", ".join(str(event.id) for event in events)
+        traceback.print_exc()
+        error = traceback.format_exc()
+        errors = dict((event.pk, error) for event in events)
+
+    for event in events:
+        if event.pk in errors:
+            QueuedEvent.objects.filter(pk=event.pk).update(
+                state=QueuedEvent.FAILED, error=errors[event.pk],
+                attempts=event.attempts + 1)
+    QueuedEvent.objects.filter(pk__in=[event.pk for event in events
+                                       if event.pk not in errors]).delete()
+    if errors:
+        eventlog.finish(decision="error")
+    else:
+        eventlog.decide("handled")
+        eventlog.finish()
+    return len(errors)
+
+class Dispatcher(object):
+    """ Drains the QueuedEvent spool with a pool of worker threads
+
+    A single poller thread claims new events and feeds them to the
+    workers, so several dispatcher processes can share one spool.
+    Events are left alone until they are window seconds old, and the
+    events of one push claimed together are run as one group. Builds
+    whose quiet period is over and builds triggered from the admin are
+    launched from the poller, the latter at most batch_build_rate a
+    second.
+    """
+
+    def __init__(self, workers=None, interval=None, stats_interval=None,
+                 window=None, batch_rate=None):
+        self.workers = workers or settings.DISPATCHER_WORKERS
+        self.interval = interval or settings.DISPATCHER_POLL_INTERVAL
+        if window is None:
+            window = settings.DISPATCHER_COALESCE_WINDOW
+        self.window = window
+        self.stats_interval = stats_interval or settings.DISPATCHER_STATS_INTERVAL
+        if batch_rate is None:
+            batch_rate = settings.BATCH_BUILD_RATE
+        self.pacer = Pacer(batch_rate)
+        self.queue = Queue.Queue(maxsize=self.workers * 2)
+        self.lock = threading.Lock()
+        self.done = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._last_stats = 0
+        self._last_requeue = 0
+
+    def requeue_stale(self):
+        """ Return events claimed by a dispatcher that went away """
+
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=settings.DISPATCHER_STALE_AFTER)
+        count = QueuedEvent.objects.filter(state=QueuedEvent.RUNNING,
+                                           claimed__lt=cutoff).update(state=QueuedEvent.NEW)
+        if count:
+            print "requeued %s stale event(s)" % count
+
+    def claim(self, limit):
+        """ Atomically mark new events as running, returns lists of event
+            ids grouped by batch key. At most limit groups are returned.
+        """
+
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=self.window)
+        candidates = QueuedEvent.objects.filter(state=QueuedEvent.NEW,
+                                                received__lte=cutoff)
+        groups = OrderedDict()
+        # bound the scan, a deep backlog is worked off over several polls
+        for pk, key in candidates.order_by('id').values_list('id', 'batch_key')[:limit * 50]:
+            if key not in groups:
+                if len(groups) >= limit:
+                    continue
+                groups[key] = []
+            if QueuedEvent.objects.filter(pk=pk, state=QueuedEvent.NEW).update(
+                    state=QueuedEvent.RUNNING, claimed=datetime.datetime.now()):
+                groups[key].append(pk)
+        return [pks for pks in groups.values() if pks]
+
+    def stats(self):
+        """ Queue depth and throughput counters """
+
+        with self.lock:
+            done, failed = self.done, self.failed
+        return { "pending" : QueuedEvent.objects.filter(state=QueuedEvent.NEW).count(),
+                 "running" : QueuedEvent.objects.filter(state=QueuedEvent.RUNNING).count(),
+                 "failed" : QueuedEvent.objects.filter(state=QueuedEvent.FAILED).count(),
+                 "inflight" : self.queue.qsize(),
+                 "done" : done,
+                 "errors" : failed }
+
+    def report(self, force=False):
+        now = time.time()
+        if force or now - self._last_stats >= self.stats_interval:
+            self._last_stats = now
+            print "dispatcher: %(pending)s pending, %(running)s running, %(failed)s failed, " \
+                  "%(inflight)s in flight, %(done)s done, %(errors)s errors" % self.stats()
+
+    def work(self):
+        while True:
+            pks = self.queue.get()
+            if pks is None:
+                self.queue.task_done()
+                break
+            try:
+                events = list(QueuedEvent.objects.filter(pk__in=pks).order_by('id'))
+                if not events:
+                    continue
+                failed = run_events(events)
+                with self.lock:
+                    self.done += len(events) - failed
+                    self.failed += failed
+            finally:
+                connection.close()
+                self.queue.task_done()
+
+    def poll(self):
+        """ Claim what the workers can take right now, returns the count """
+
+        free = self.queue.maxsize - self.queue.qsize()
+        if free <= 0:
+            return 0
+        claimed = self.claim(free)
+        for pks in claimed:
+            self.queue.put(pks)
+        return len(claimed)
+
+    def launch_batches(self):
+        """ Launch the batched builds the rate allows right now """
+
+        now = time.time()
+        if now - self._last_requeue >= BATCH_WATCH_INTERVAL:
+            # builds claimed by a web process that went away
+            self._last_requeue = now
+            requeue_stale_builds()
+        allowed = self.pacer.allowance(BATCH_CHUNK)
+        if allowed:
+            self.pacer.spend(launch_batched_builds(allowed))
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, once=False):
+        self.requeue_stale()
+        threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name="dispatcher-%s" % i)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        try:
+            while not self._stop.is_set():
+                claimed = self.poll()
+                launch_due_builds()
+                self.launch_batches()
+                self.report()
+                if once and not claimed:
+                    self.queue.join()
+                    if not self.poll():
+                        break
+                elif not claimed:
+                    self._stop.wait(self.interval)
+        finally:
+            for thread in threads:
+                self.queue.put(None)
+            for thread in threads:
+                thread.join()
+            self.report(force=True)
+            connection.close()
@@ -0,0 +1,138 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" bounded, single line structured log of webhook events
+
+Code handling an event records what it found and decided on the event
+of the current thread; one JSON line is logged per event when it is
+finished:
+
+  eventlog.begin(provider="github")
+  eventlog.note(repo=repourl, revision=revision)
+  eventlog.add("launches", "notify:%s" % mapobj.id)
+  eventlog.decide("handled")
+  eventlog.finish()
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger("webhook_launcher.events")
+
+_local = threading.local()
+
+class Event(object):
+    """ Facts about one webhook event, logged as one line """
+
+    def __init__(self, **fields):
+        self.started = time.time()
+        self.fields = OrderedDict(sorted(fields.items()))
+        self.timings = OrderedDict()
+
+    def note(self, **fields):
+        self.fields.update(fields)
+
+    def decide(self, decision):
+        self.fields.setdefault("decision", decision)
+
+    def add(self, key, value):
+        self.fields.setdefault(key, []).append(value)
+
+    def time(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0) + seconds
+
+    def line(self, limit):
+        record = OrderedDict(self.fields)
+        record["ms"] = int((time.time() - self.started) * 1000)
+        for stage, seconds in self.timings.items():
+            record["%s_ms" % stage] = int(seconds * 1000)
+        line = json.dumps(record, default=unicode)
+        if len(line) > limit:
+            # keep the line parseable, lists become their length
+            for key, value in record.items():
+                if isinstance(value, list):
+                    record[key] = "%s items" % len(value)
+            line = json.dumps(record, default=unicode)
+        if len(line) > limit:
+            line = line[:limit] + "..."
+        return line
+
+class _NoEvent(object):
+    """ Stands in when no event is being recorded in this thread """
+
+    def note(self, **fields):
+        pass
+
+    def decide(self, decision):
+        pass
+
+    def add(self, key, value):
+        pass
+
+    def time(self, stage, seconds):
+        pass
+
+_no_event = _NoEvent()
+
+def begin(**fields):
+    """ Start recording an event in this thread """
+
+    _local.event = Event(**fields)
+    return _local.event
+
+def current():
+    return getattr(_local, "event", None) or _no_event
+
+def note(**fields):
+    current().note(**fields)
+
+def decide(decision):
+    """ Set the decision unless an earlier one was recorded """
+
+    current().decide(decision)
+
+def add(key, value):
+    current().add(key, value)
+
+def finish(**fields):
+    """ Log the event of this thread, subject to sampling. Events that
+        failed are always logged.
+    """
+
+    event = getattr(_local, "event", None)
+    _local.event = None
+    if event is None:
+        return
+    event.note(**fields)
+    if (event.fields.get("decision") != "error" and
+        settings.EVENT_LOG_SAMPLE < 1 and
+        random.random() >= settings.EVENT_LOG_SAMPLE):
+        return
+    logger.info(event.line(settings.EVENT_LOG_MAX_BYTES))
+
+def payload(data):
+    """ Log a full raw payload, only in debug mode """
+
+    if settings.EVENT_LOG_PAYLOADS:
+        logger.debug(json.dumps(data, indent=2))
@@ -0,0 +1,174 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" shared, timeout bounded HTTP client for provider APIs """
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from cStringIO import StringIO
+
+import pycurl
+
+class HTTPError(Exception):
+    """ A response other than 2xx or 304 """
+
+    def __init__(self, url, status):
+        Exception.__init__(self, "%s returned %s" % (url, status))
+        self.url = url
+        self.status = status
+
+class HTTPClient(object):
+    """ GETs over kept alive connections, with a conditional JSON cache
+
+    Each thread reuses its own curl handle, so connections to the same
+    host stay open between calls; DNS and TLS sessions are shared
+    between the handles. JSON responses can be cached for a ttl, after
+    which they are revalidated with If-None-Match / If-Modified-Since;
+    a ttl of 0 revalidates on every call.
+    """
+
+    def __init__(self, connect_timeout=5, timeout=20, proxy=None, proxy_port=None,
+                 cache_size=1000):
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.proxy = proxy
+        self.proxy_port = proxy_port
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.local = threading.local()
+        self.share = None
+        # handles of all threads, to close them after a fork
+        self.handles = []
+
+    def _handle(self):
+        curl = getattr(self.local, "curl", None)
+        if curl is not None:
+            return curl
+        with self.lock:
+            if self.share is None:
+                self.share = pycurl.CurlShare()
+                self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+                self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+            curl = pycurl.Curl()
+            curl.setopt(pycurl.SHARE, self.share)
+            self.handles.append(curl)
+        curl.setopt(pycurl.NOSIGNAL, 1)
+        curl.setopt(pycurl.CONNECTTIMEOUT, self.connect_timeout)
+        curl.setopt(pycurl.TIMEOUT, self.timeout)
+        curl.setopt(pycurl.SSL_VERIFYPEER, 0)
+        curl.setopt(pycurl.SSL_VERIFYHOST, 0)
+        curl.setopt(pycurl.NETRC, 1)
+        if self.proxy:
+            curl.setopt(pycurl.PROXY, self.proxy)
+            if self.proxy_port:
+                curl.setopt(pycurl.PROXYPORT, int(self.proxy_port))
+        self.local.curl = curl
+        return curl
+
+    def _drop_handle(self):
+        curl = getattr(self.local, "curl", None)
+        self.local.curl = None
+        if curl is None:
+            return
+        with self.lock:
+            if curl in self.handles:
+                self.handles.remove(curl)
+        curl.close()
+
+    def get(self, url, headers=None):
+        """ (status, lower cased response headers, body) of a GET of url """
+
+        curl = self._handle()
+        body = StringIO()
+        received = {}
+
+        def header(line):
+            if ":" in line:
+                name, value = line.split(":", 1)
+                received[name.strip().lower()] = value.strip()
+
+        curl.setopt(pycurl.URL, str(url))
+        curl.setopt(pycurl.HTTPHEADER, ["%s: %s" % item for item in (headers or {}).items()])
+        curl.setopt(pycurl.WRITEFUNCTION, body.write)
+        curl.setopt(pycurl.HEADERFUNCTION, header)
+        try:
+            curl.perform()
+        except pycurl.error:
+            # the connection may be in any state, start over next time
+            self._drop_handle()
+            raise
+        return curl.getinfo(pycurl.RESPONSE_CODE), received, body.getvalue()
+
+    def get_json(self, url, ttl=None):
+        """ Decoded JSON of url, from the cache when it is younger than
+            ttl seconds or the server says it didn't change. A ttl of None
+            doesn't cache.
+        """
+
+        with self.lock:
+            cached = self.cache.get(url)
+        now = time.time()
+        if cached is not None and ttl and now - cached["fetched"] < ttl:
+            return cached["data"]
+
+        headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        status, received, body = self.get(url, headers)
+
+        if status == 304 and cached is not None:
+            data = cached["data"]
+            received.setdefault("etag", cached["etag"])
+            received.setdefault("last-modified", cached["last_modified"])
+        elif 200 <= status < 300:
+            data = json.loads(body)
+        else:
+            raise HTTPError(url, status)
+
+        if ttl is not None:
+            self._remember(url, { "fetched" : now,
+                                  "etag" : received.get("etag"),
+                                  "last_modified" : received.get("last-modified"),
+                                  "data" : data })
+        return data
+
+    def _remember(self, url, entry):
+        with self.lock:
+            self.cache.pop(url, None)
+            self.cache[url] = entry
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def close(self):
+        """ Drop all handles and their connections """
+
+        with self.lock:
+            handles, self.handles = self.handles, []
+            self.share = None
+        self.local = threading.local()
+        for curl in handles:
+            try:
+                curl.close()
+            except pycurl.error:
+                pass
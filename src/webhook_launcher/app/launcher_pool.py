@@ -0,0 +1,154 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" process wide pool of persistent BOSS launchers """
+
+import threading
+import time
+
+from RuoteAMQP import Launcher
+
+class RecordingLauncher(object):
+    """ Stands in for Launcher in load tests, launches are only counted
+
+    Counts are kept on the class since the pool creates launchers on
+    demand. delay simulates the time BOSS takes to accept a launch.
+    """
+
+    lock = threading.Lock()
+    launches = {}
+    delay = 0
+
+    def __init__(self, amqp_host=None, amqp_user=None, amqp_pass=None,
+                 amqp_vhost=None):
+        self.amqp_host = amqp_host
+
+    def launch(self, process, fields):
+        kind = "notify" if "msg" in fields else "build"
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            self.launches[kind] = self.launches.get(kind, 0) + 1
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            launches = cls.launches
+            cls.launches = {}
+        return launches
+
+class LauncherPool(object):
+    """ Keeps AMQP connections to BOSS open between launches
+
+    Launchers are pooled per (host, user, vhost). At most max_size
+    launchers per key are handed out at once, idle ones older than
+    max_idle seconds or with a closed channel are reconnected, and a
+    launch that fails on a pooled connection is retried once on a
+    fresh one.
+    """
+
+    def __init__(self, max_size=4, max_idle=300, launcher_class=Launcher):
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.launcher_class = launcher_class
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.slots = {}
+        self.connects = 0
+
+    def _slot(self, key):
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(self.max_size)
+                self.idle[key] = []
+            return self.slots[key]
+
+    def _connect(self, host, user, password, vhost):
+        with self.lock:
+            self.connects += 1
+        return self.launcher_class(amqp_host = host,
+                                   amqp_user = user,
+                                   amqp_pass = password,
+                                   amqp_vhost = vhost)
+
+    def _healthy(self, launcher, last_used):
+        if time.time() - last_used > self.max_idle:
+            return False
+        chan = getattr(launcher, "chan", None)
+        if chan is not None and not getattr(chan, "is_open", True):
+            return False
+        return True
+
+    def _close(self, launcher):
+        for name in ("chan", "conn"):
+            obj = getattr(launcher, name, None)
+            if obj is None:
+                continue
+            try:
+                obj.close()
+            except Exception:
+                pass
+
+    def _checkout(self, key, password):
+        while True:
+            with self.lock:
+                if not self.idle[key]:
+                    break
+                launcher, last_used = self.idle[key].pop()
+            if self._healthy(launcher, last_used):
+                return launcher
+            self._close(launcher)
+        return self._connect(key[0], key[1], password, key[2])
+
+    def _checkin(self, key, launcher):
+        with self.lock:
+            self.idle[key].append((launcher, time.time()))
+
+    def launch(self, host, user, password, vhost, process, fields):
+        """ Launch process with fields on the given BOSS instance """
+
+        key = (host, user, vhost)
+        slot = self._slot(key)
+        slot.acquire()
+        try:
+            launcher = self._checkout(key, password)
+            try:
+                launcher.launch(process, fields)
+            except Exception:
+                # most likely a stale connection, BOSS or the broker
+                # restarted. retry once on a new one
+                self._close(launcher)
+                launcher = self._connect(host, user, password, vhost)
+                try:
+                    launcher.launch(process, fields)
+                except Exception:
+                    self._close(launcher)
+                    raise
+            self._checkin(key, launcher)
+        finally:
+            slot.release()
+
+    def close(self):
+        """ Drop all idle launchers """
+
+        with self.lock:
+            idle = self.idle
+            self.idle = dict((key, []) for key in idle)
+        for launchers in idle.values():
+            for launcher, last_used in launchers:
+                self._close(launcher)
@@ -0,0 +1,398 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" replay of recorded webhook payloads, used by replay_webhooks
+
+The corpus in the replay directory holds one payload per kind of event.
+Each round of a replay turns the selected scenarios into fresh events,
+with new revisions and delivery ids so that nothing is skipped as
+already seen.
+"""
+
+import contextlib
+import copy
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import urllib2
+import uuid
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay")
+
+SCENARIOS = ("push", "large-push", "tag-burst", "annotated-tag", "delete",
+             "bitbucket-push")
+
+# staff pages, only replayed through the test client
+ADMIN_SCENARIOS = { "admin-mappings" : "admin/app/webhookmapping/",
+                    "admin-queuedevents" : "admin/app/queuedevent/",
+                    "admin-pendingbuilds" : "admin/app/pendingbuild/" }
+
+GITHUB_REPO = "https://github.com/example/project.git"
+BITBUCKET_REPO = "https://bitbucket.org/example/project.git"
+
+ZEROSHA = "0000000000000000000000000000000000000000"
+
+def load_corpus(path=CORPUS_DIR):
+    """ name -> recorded event of every json file in path """
+
+    corpus = {}
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".json"):
+            with open(os.path.join(path, name)) as cfile:
+                corpus[name[:-5]] = json.load(cfile)
+    return corpus
+
+def sha(*parts):
+    return hashlib.sha1("-".join(str(part) for part in parts)).hexdigest()
+
+class Event(object):
+    """ One request of a replay, a webhook POST or a GET of path """
+
+    def __init__(self, scenario, recorded=None, payload=None, path=""):
+        self.scenario = scenario
+        self.path = path
+        self.headers = {}
+        self.body = None
+        if recorded is not None:
+            self.headers.update(recorded.get("headers", {}))
+            if recorded["provider"] == "github":
+                self.headers["X-GitHub-Delivery"] = str(uuid.uuid4())
+            self.body = json.dumps(payload)
+
+    def meta(self):
+        """ headers in the form the django test client takes them """
+
+        return dict(("HTTP_%s" % name.upper().replace("-", "_"), value)
+                    for name, value in self.headers.items())
+
+class Corpus(object):
+    """ Generates the events of replay rounds from the recorded payloads """
+
+    def __init__(self, scenarios=SCENARIOS, commits=500, tags=20, path=CORPUS_DIR):
+        self.scenarios = scenarios
+        self.commits = commits
+        self.tags = tags
+        self.recorded = load_corpus(path)
+        # (repourl, branch) of mappings the events expect to exist
+        self.branches = set()
+
+    def _github(self, name, ref, after, head=None, commits=None):
+        recorded = self.recorded[name]
+        payload = copy.deepcopy(recorded["payload"])
+        payload["ref"] = ref
+        payload["after"] = after
+        if head is not None:
+            payload["head_commit"]["id"] = head
+        if commits is not None:
+            template = payload["commits"][0]
+            payload["commits"] = []
+            for rev in commits:
+                commit = dict(template, id=rev, url=template["url"].rsplit("/", 1)[0] + "/" + rev)
+                payload["commits"].append(commit)
+        return recorded, payload
+
+    def round(self, number):
+        """ Events of round number, in the order they are posted """
+
+        events = []
+        head = sha("master", number)
+        for scenario in self.scenarios:
+            if scenario == "push":
+                recorded, payload = self._github("github_push", "refs/heads/master",
+                                                 head, head, [head])
+                events.append(Event(scenario, recorded, payload))
+                self.branches.add((GITHUB_REPO, "master"))
+
+            elif scenario == "large-push":
+                revs = [sha("devel", number, i) for i in range(self.commits)]
+                recorded, payload = self._github("github_push", "refs/heads/devel",
+                                                 revs[-1], revs[-1], revs)
+                events.append(Event(scenario, recorded, payload))
+                self.branches.add((GITHUB_REPO, "devel"))
+
+            elif scenario == "tag-burst":
+                # a release script pushing many tags on the same commit
+                for i in range(self.tags):
+                    recorded, payload = self._github("github_tag",
+                                                     "refs/tags/%s.%s" % (number, i),
+                                                     head, head)
+                    events.append(Event(scenario, recorded, payload))
+                self.branches.add((GITHUB_REPO, "master"))
+
+            elif scenario == "annotated-tag":
+                recorded, payload = self._github("github_annotated_tag",
+                                                 "refs/tags/%s-annotated" % number,
+                                                 sha("tag", number), head)
+                events.append(Event(scenario, recorded, payload))
+                self.branches.add((GITHUB_REPO, "master"))
+
+            elif scenario == "delete":
+                branch = "gone-%s" % number
+                recorded, payload = self._github("github_delete", "refs/heads/%s" % branch,
+                                                 ZEROSHA)
+                events.append(Event(scenario, recorded, payload))
+                self.branches.add((GITHUB_REPO, branch))
+
+            elif scenario == "bitbucket-push":
+                recorded = self.recorded["bitbucket_push"]
+                payload = copy.deepcopy(recorded["payload"])
+                rev = sha("bitbucket", number)
+                payload["commits"][0]["raw_node"] = rev
+                payload["commits"][0]["node"] = rev[:12]
+                events.append(Event(scenario, recorded, payload))
+                self.branches.add((BITBUCKET_REPO, "master"))
+
+            elif scenario in ADMIN_SCENARIOS:
+                events.append(Event(scenario, path=ADMIN_SCENARIOS[scenario]))
+
+            else:
+                raise ValueError("unknown scenario %s" % scenario)
+        return events
+
+def create_fixtures(branches, count):
+    """ count complete mappings for each (repourl, branch), owned by a
+        superuser replay with password replay. Returns its login.
+    """
+
+    from django.contrib.auth.models import User
+    from webhook_launcher.app.models import BuildService, WebHookMapping
+    from webhook_launcher.app.routes import route_table
+
+    # placeholders are owned by the user with id 1
+    user = User.objects.create(id=1, username="replay", is_staff=True,
+                               is_superuser=True)
+    user.set_password("replay")
+    user.save()
+    obs = BuildService.objects.create(namespace="replay",
+                                      apiurl="https://api.replay.invalid")
+    mappings = []
+    for repourl, branch in sorted(branches):
+        host = repourl.split("/")[2].split(".")[0]
+        for number in range(count):
+            mappings.append(WebHookMapping(repourl=repourl, branch=branch,
+                                           project="replay:%s:%s" % (host, branch),
+                                           package="project-%s" % number,
+                                           notify=True, build=True,
+                                           user=user, obs=obs))
+    WebHookMapping.objects.bulk_create(mappings)
+    # bulk inserts send no signals
+    route_table.invalidate()
+    return "replay", "replay"
+
+@contextlib.contextmanager
+def test_database():
+    """ Run the block on a throwaway test database, whose tables are
+        created by the migrations like in production
+    """
+
+    from django.db import connection
+    from south.management.commands import patch_for_test_db_setup
+
+    patch_for_test_db_setup()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+def percentile(values, pct):
+    """ Nearest rank percentile of sorted values """
+
+    if not values:
+        return 0
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+class Result(object):
+    """ Latencies, statuses and query counts of a replay """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.queries = {}
+        self.statuses = {}
+        self.query_time = 0.0
+        # live servers don't tell their query counts
+        self.counted = False
+        self.started = None
+        self.elapsed = 0
+
+    def record(self, scenario, latency, status, queries=None, query_time=0.0):
+        with self.lock:
+            self.latencies.setdefault(scenario, []).append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if queries is not None:
+                self.counted = True
+                self.queries[scenario] = self.queries.get(scenario, 0) + queries
+                self.query_time += query_time
+
+    def _stats(self, latencies, queries):
+        latencies = sorted(latencies)
+        stats = { "events" : len(latencies) }
+        for pct in (50, 90, 99):
+            stats["p%s_ms" % pct] = round(percentile(latencies, pct) * 1000, 2)
+        stats["max_ms"] = round(latencies[-1] * 1000, 2) if latencies else 0
+        if latencies and self.counted:
+            stats["queries_per_event"] = round(float(queries) / len(latencies), 2)
+        return stats
+
+    def summary(self):
+        latencies = [latency for values in self.latencies.values() for latency in values]
+        summary = self._stats(latencies, sum(self.queries.values()))
+        summary["elapsed"] = round(self.elapsed, 3)
+        summary["throughput"] = round(len(latencies) / self.elapsed, 2) if self.elapsed else 0
+        summary["statuses"] = dict((str(status), count)
+                                   for status, count in self.statuses.items())
+        if latencies and self.counted:
+            summary["query_ms_per_event"] = round(self.query_time * 1000 / len(latencies), 2)
+        summary["scenarios"] = dict((scenario, self._stats(values, self.queries.get(scenario, 0)))
+                                    for scenario, values in self.latencies.items())
+        return summary
+
+class Replayer(object):
+    """ Posts events at a fixed rate, or as fast as possible with rate 0
+
+    Subclasses post an event with post(event), which returns (status,
+    queries, query seconds); queries is None when they can't be counted.
+    """
+
+    def __init__(self, rate=0):
+        self.rate = rate
+
+    def _pace(self, started, number):
+        if self.rate:
+            wait = started + number / float(self.rate) - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+    def replay(self, events, result, concurrency=1):
+        events = list(events)
+        result.started = time.time()
+        if concurrency <= 1:
+            for number, event in enumerate(events):
+                self._pace(result.started, number)
+                self._timed(event, result)
+        else:
+            position = [0]
+            lock = threading.Lock()
+
+            def worker():
+                while True:
+                    with lock:
+                        number = position[0]
+                        position[0] += 1
+                    if number >= len(events):
+                        return
+                    self._pace(result.started, number)
+                    self._timed(events[number], result)
+
+            threads = [threading.Thread(target=worker) for i in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        result.elapsed = time.time() - result.started
+        return result
+
+    def _timed(self, event, result):
+        started = time.time()
+        status, queries, query_time = self.post(event)
+        result.record(event.scenario, time.time() - started, status, queries, query_time)
+
+class ClientReplayer(Replayer):
+    """ Posts through the django test client, in this process """
+
+    def __init__(self, rate=0, remote_addr="127.0.0.1", login=None):
+        super(ClientReplayer, self).__init__(rate)
+        from django.conf import settings
+        from django.test.client import Client
+        self.client = Client(REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=remote_addr)
+        if login:
+            self.client.login(username=login[0], password=login[1])
+        self.prefix = "/%s/" % settings.URL_PREFIX
+
+    def post(self, event):
+        from webhook_launcher.app.querycount import count_queries
+        with count_queries() as counted:
+            if event.body is None:
+                response = self.client.get(self.prefix + event.path)
+            else:
+                response = self.client.post(self.prefix + event.path, event.body,
+                                            content_type="application/json",
+                                            **event.meta())
+        return response.status_code, counted.count, counted.seconds
+
+class HTTPReplayer(Replayer):
+    """ Posts to a live webhook launcher """
+
+    def __init__(self, url, rate=0, timeout=30):
+        super(HTTPReplayer, self).__init__(rate)
+        self.url = url
+        self.timeout = timeout
+
+    def post(self, event):
+        headers = dict(event.headers)
+        headers["Content-Type"] = "application/json"
+        request = urllib2.Request(self.url + event.path, event.body, headers)
+        try:
+            response = urllib2.urlopen(request, timeout=self.timeout)
+            response.read()
+            return response.getcode(), None, 0.0
+        except urllib2.HTTPError, exc:
+            return exc.code, None, 0.0
+        except Exception:
+            return "error", None, 0.0
+
+def over_budget(summary, budgets):
+    """ Scenarios making more queries per event than their budget
+
+    :param budgets: scenario -> queries per event, "*" applies to
+                    scenarios without a budget of their own
+    """
+
+    failures = []
+    for scenario, stats in sorted(summary.get("scenarios", {}).items()):
+        budget = budgets.get(scenario, budgets.get("*"))
+        if budget is not None and stats.get("queries_per_event", 0) > budget:
+            failures.append("%s: %s queries per event, budget %s" %
+                            (scenario, stats["queries_per_event"], budget))
+    return failures
+
+def compare(summary, baseline, tolerance):
+    """ Regressions of summary against a stored baseline summary """
+
+    regressions = []
+    if baseline.get("throughput") and \
+       summary["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append("throughput %s/s, baseline %s/s" %
+                           (summary["throughput"], baseline["throughput"]))
+    for key in ("p50_ms", "p90_ms"):
+        if baseline.get(key) and summary[key] > baseline[key] * (1 + tolerance):
+            regressions.append("%s %s, baseline %s" % (key, summary[key], baseline[key]))
+    # query counts don't depend on the machine, any increase counts
+    scenarios = summary.get("scenarios", {})
+    for scenario, stats in sorted(baseline.get("scenarios", {}).items()):
+        queries = scenarios.get(scenario, {}).get("queries_per_event", 0)
+        if "queries_per_event" in stats and queries > stats["queries_per_event"]:
+            regressions.append("%s: %s queries per event, baseline %s" %
+                               (scenario, queries, stats["queries_per_event"]))
+    return regressions
@@ -0,0 +1,186 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import json
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from webhook_launcher.app import loadtest
+from webhook_launcher.app.launcher_pool import RecordingLauncher
+
+# process definitions of this tree, a checkout has no installed ones
+PROCESSES = os.path.join(settings.PROJECT_DIR, "processes")
+
+class Command(BaseCommand):
+    help = ("Replay recorded github and bitbucket webhooks and report throughput, "
+            "latency and query counts. By default the events are posted through the "
+            "test client to a throwaway test database with launches only recorded; "
+            "with --url they are posted to a running server, which should have "
+            "launcher_stub enabled.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--url', dest='url', default=None,
+                    help='post to a live server at this url instead of the test client'),
+        make_option('--scenario', action='append', dest='scenarios', default=None,
+                    choices=loadtest.SCENARIOS + tuple(sorted(loadtest.ADMIN_SCENARIOS)),
+                    help='scenario to replay, can be repeated. default: all of %s' %
+                         ", ".join(loadtest.SCENARIOS)),
+        make_option('--admin', action='store_true', dest='admin', default=False,
+                    help='also load the admin changelists: %s' %
+                         ", ".join(sorted(loadtest.ADMIN_SCENARIOS))),
+        make_option('--rounds', type='int', dest='rounds', default=10,
+                    help='number of times each scenario is replayed'),
+        make_option('--rate', type='float', dest='rate', default=0,
+                    help='events per second, 0 posts as fast as possible'),
+        make_option('--concurrency', type='int', dest='concurrency', default=1,
+                    help='concurrent posters, only with --url'),
+        make_option('--commits', type='int', dest='commits', default=500,
+                    help='commits in a large push'),
+        make_option('--tags', type='int', dest='tags', default=20,
+                    help='tags in a tag burst'),
+        make_option('--mappings', type='int', dest='mappings', default=1,
+                    help='mappings per branch in the test database'),
+        make_option('--launch-delay', type='float', dest='launch_delay', default=0,
+                    help='milliseconds the stub launcher takes per launch'),
+        make_option('--remote-addr', dest='remote_addr', default='127.0.0.1',
+                    help='client address of test client posts'),
+        make_option('--budget', action='append', dest='budgets', default=[],
+                    help='SCENARIO=N, fail if SCENARIO makes more than N queries per '
+                         'event. * sets the budget of all other scenarios'),
+        make_option('--baseline', dest='baseline', default=None,
+                    help='fail if the results regress from this stored baseline'),
+        make_option('--tolerance', type='float', dest='tolerance', default=0.2,
+                    help='allowed timing regression as a fraction, default 0.2'),
+        make_option('--save-baseline', dest='save_baseline', default=None,
+                    help='store the results as a baseline in this file'),
+    )
+
+    def handle(self, *args, **options):
+        scenarios = list(options['scenarios'] or loadtest.SCENARIOS)
+        if options['admin']:
+            scenarios.extend(sorted(loadtest.ADMIN_SCENARIOS))
+        if options['concurrency'] > 1 and not options['url']:
+            raise CommandError("--concurrency needs --url, the test client is not thread safe")
+        if options['url'] and set(scenarios) & set(loadtest.ADMIN_SCENARIOS):
+            raise CommandError("admin pages are only loaded through the test client")
+
+        budgets = {}
+        for budget in options['budgets']:
+            try:
+                scenario, queries = budget.split("=", 1)
+                budgets[scenario.strip()] = float(queries)
+            except ValueError:
+                raise CommandError("--budget takes SCENARIO=N, not %s" % budget)
+        if budgets and options['url']:
+            raise CommandError("queries of a live server can't be counted, --budget needs the test client")
+
+        config = { "scenarios" : sorted(scenarios),
+                   "rounds" : options['rounds'],
+                   "rate" : options['rate'],
+                   "concurrency" : options['concurrency'],
+                   "commits" : options['commits'],
+                   "tags" : options['tags'],
+                   "mappings" : options['mappings'],
+                   "launch_delay" : options['launch_delay'],
+                   "live" : bool(options['url']) }
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as bfile:
+                baseline = json.load(bfile)
+            if baseline.get("config") != config:
+                raise CommandError("%s was recorded with different options: %s" %
+                                   (options['baseline'], baseline.get("config")))
+
+        corpus = loadtest.Corpus(scenarios, commits=options['commits'], tags=options['tags'])
+        events = []
+        for number in range(options['rounds']):
+            events.extend(corpus.round(number))
+
+        result = loadtest.Result()
+        if options['url']:
+            replayer = loadtest.HTTPReplayer(options['url'], rate=options['rate'])
+            replayer.replay(events, result, concurrency=options['concurrency'])
+            launches = {}
+        else:
+            launches = self._replay_locally(corpus, events, result, options)
+
+        summary = result.summary()
+        summary["launches"] = launches
+        self._report(summary)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], "w") as bfile:
+                json.dump({ "config" : config, "summary" : summary }, bfile,
+                          indent=2, sort_keys=True)
+            print "Baseline saved to %s" % options['save_baseline']
+
+        failures = []
+        if budgets:
+            failures.extend(loadtest.over_budget(summary, budgets))
+        if baseline is not None:
+            failures.extend(loadtest.compare(summary, baseline["summary"], options['tolerance']))
+        if failures:
+            raise CommandError("Regressed:\n  %s" % "\n  ".join(failures))
+        if budgets or baseline is not None:
+            print "No regression"
+
+    def _replay_locally(self, corpus, events, result, options):
+        """ Replay through the test client on a test database """
+
+        from webhook_launcher.app.utils import launcher_pool
+
+        launcher_pool.close()
+        launcher_pool.launcher_class = RecordingLauncher
+        RecordingLauncher.delay = options['launch_delay'] / 1000.0
+        RecordingLauncher.reset()
+
+        processes = override_settings(
+            VCSCOMMIT_NOTIFY=os.path.join(PROCESSES, "VCSCOMMIT_NOTIFY"),
+            VCSCOMMIT_BUILD=os.path.join(PROCESSES, "VCSCOMMIT_BUILD"))
+        with processes, loadtest.test_database():
+            login = loadtest.create_fixtures(corpus.branches, options['mappings'])
+            replayer = loadtest.ClientReplayer(rate=options['rate'],
+                                               remote_addr=options['remote_addr'],
+                                               login=login)
+            replayer.replay(events, result)
+            if settings.ASYNC_DISPATCH:
+                # the posts were only spooled, launch them too
+                from webhook_launcher.app.dispatcher import Dispatcher
+                started = time.time()
+                Dispatcher(window=0).run(once=True)
+                print "Dispatched spooled events in %.3fs" % (time.time() - started)
+        return RecordingLauncher.reset()
+
+    def _report(self, summary):
+        print "%(events)s events in %(elapsed)ss, %(throughput)s/s" % summary
+        print "latency ms: p50 %(p50_ms)s  p90 %(p90_ms)s  p99 %(p99_ms)s  max %(max_ms)s" % summary
+        if "query_ms_per_event" in summary:
+            print "queries per event: %(queries_per_event)s, %(query_ms_per_event)s ms" % summary
+        print "statuses: %s" % ", ".join("%s x%s" % item for item in sorted(summary["statuses"].items()))
+        if summary["launches"]:
+            print "launches: %s" % ", ".join("%s x%s" % item for item in sorted(summary["launches"].items()))
+        for scenario, stats in sorted(summary["scenarios"].items()):
+            print "  %-16s %5s events  p50 %8s ms  p90 %8s ms  %s queries/event" % (
+                scenario, stats["events"], stats["p50_ms"], stats["p90_ms"],
+                stats.get("queries_per_event", "-"))
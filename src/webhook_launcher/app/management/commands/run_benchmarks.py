@@ -0,0 +1,44 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from webhook_launcher.app.benchmarks import BENCHMARKS
+
+class Command(BaseCommand):
+    args = "[NAME ...]"
+    help = ("Run micro benchmarks of the webhook hot paths and print operations "
+            "per second. Benchmarks: %s" % ", ".join(BENCHMARKS))
+
+    option_list = BaseCommand.option_list + (
+        make_option('--seconds', type='float', dest='seconds', default=0.5,
+                    help='seconds each case and variant runs for'),
+    )
+
+    def handle(self, *names, **options):
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError("unknown benchmark(s) %s, choose from %s" %
+                               (", ".join(unknown), ", ".join(BENCHMARKS)))
+
+        for name in names or BENCHMARKS:
+            print name
+            for case, variant, per_second in BENCHMARKS[name](options['seconds']):
+                print "  %-36s %-10s %12.1f/s" % (case, variant, per_second)
@@ -0,0 +1,50 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import signal
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from webhook_launcher.app.dispatcher import Dispatcher
+
+class Command(BaseCommand):
+    help = "Launch BOSS processes for webhook events spooled by the webhook view"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=None,
+                    help='number of concurrent worker threads'),
+        make_option('--interval', type='float', dest='interval', default=None,
+                    help='seconds to sleep when the spool is empty'),
+        make_option('--window', type='float', dest='window', default=None,
+                    help='seconds to wait for more events of the same push'),
+        make_option('--once', action='store_true', dest='once', default=False,
+                    help='drain the spool and exit'),
+    )
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(workers=options['workers'],
+                                interval=options['interval'],
+                                window=options['window'])
+
+        def _stop(signum, frame):
+            dispatcher.stop()
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        dispatcher.run(once=options['once'])
@@ -0,0 +1,141 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" in process counters and histograms, exposed in prometheus text format
+
+Stages of handling a webhook are timed with
+
+  with metrics.timer("decode"):
+      data = simplejson.loads(payload)
+
+which feeds the webhook_stage_seconds histogram and the event log.
+"""
+
+import bisect
+import threading
+import time
+
+from webhook_launcher.app import eventlog
+
+HELP = {
+    "webhook_events_total" : "Webhook POSTs by provider, event type and triage result",
+    "webhook_duplicates_total" : "Redelivered webhooks acknowledged without handling them again",
+    "webhook_failures_total" : "Webhook POSTs that failed with an exception",
+    "webhook_launches_total" : "BOSS process launches by kind and result",
+    "webhook_placeholders_total" : "Placeholder mappings created for unknown branches",
+    "webhook_api_calls_total" : "Calls to provider APIs by result",
+    "webhook_request_seconds" : "Time to handle a webhook POST, by response status",
+    "webhook_stage_seconds" : "Time spent in each stage of handling a webhook",
+}
+
+# upper bounds in seconds, from a cached lookup to a slow BOSS
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Registry(object):
+    """ Thread safe store of labelled counters and histograms """
+
+    def __init__(self, buckets=BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        # values above the last bound only count in +Inf
+        pos = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            if pos < len(self.buckets):
+                histogram[0][pos] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def _labels(self, labels):
+        if not labels:
+            return ""
+        return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                                 for name, value in labels)
+
+    def _header(self, lines, name, kind):
+        if name in HELP:
+            lines.append("# HELP %s %s" % (name, HELP[name]))
+        lines.append("# TYPE %s %s" % (name, kind))
+
+    def render(self):
+        """ Counters and histograms in prometheus text exposition format """
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(counts), total, count))
+                                for key, (counts, total, count) in self.histograms.items())
+        lines = []
+        last = None
+        for (name, labels), value in counters:
+            if name != last:
+                self._header(lines, name, "counter")
+                last = name
+            lines.append("%s%s %s" % (name, self._labels(labels), value))
+        last = None
+        for (name, labels), (counts, total, count) in histograms:
+            if name != last:
+                self._header(lines, name, "histogram")
+                last = name
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append("%s_bucket%s %s" % (name, self._labels(labels + (("le", repr(bound)),)),
+                                                 cumulative))
+            lines.append("%s_bucket%s %s" % (name, self._labels(labels + (("le", "+Inf"),)), count))
+            lines.append("%s_sum%s %r" % (name, self._labels(labels), total))
+            lines.append("%s_count%s %s" % (name, self._labels(labels), count))
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+class timer(object):
+    """ Context manager timing a stage of the current webhook, also when
+        it raises
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        elapsed = time.time() - self.started
+        registry.observe("webhook_stage_seconds", elapsed, stage=self.stage)
+        eventlog.current().time(self.stage, elapsed)
+        return False
@@ -20,6 +20,7 @@ import urlparse
 
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth.models import Permission
@@ -87,13 +88,149 @@ class WebHookMapping(models.Model):
     user = models.ForeignKey(User)
     obs = models.ForeignKey(BuildService)
 
+    # migration 0008 adds composite indexes on (repourl, branch) and
+    # (project, package) for the webhook and participant lookups
+
 class LastSeenRevision(models.Model):
 
     def __unicode__(self):
         return "%s @ %s/%s" % ( self.revision, self.mapping.repourl, self.mapping.branch )
 
-    mapping = models.ForeignKey(WebHookMapping)
+    mapping = models.ForeignKey(WebHookMapping, unique=True)
     revision = models.CharField(max_length=250)
+    # lets the route tables reload only the revisions changed since
+    # their last look, see RouteTable._reload_revisions
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+class RouteVersion(models.Model):
+    """ Counters bumped whenever routing data changes, so that every
+        process knows when to rebuild what it derived from it. ROUTES
+        covers the mappings and build services the route table holds,
+        REVISIONS only their last seen revisions and LISTING only the
+        mappings themselves.
+    """
+
+    ROUTES = 1
+    LISTING = 2
+    REVISIONS = 3
+
+    version = models.IntegerField(default=0)
+
+    @classmethod
+    def current(cls, counter=ROUTES):
+        try:
+            return cls.objects.values_list('version', flat=True).get(pk=counter)
+        except cls.DoesNotExist:
+            return 0
+
+    @classmethod
+    def currents(cls, *counters):
+        """ counter -> version of several counters, in one query """
+
+        versions = dict((counter, 0) for counter in counters)
+        versions.update(cls.objects.filter(pk__in=counters).values_list('id', 'version'))
+        return versions
+
+    @classmethod
+    def bump(cls, counter=ROUTES):
+        if not cls.objects.filter(pk=counter).update(version=F('version') + 1):
+            _, created = cls.objects.get_or_create(pk=counter, defaults={'version' : 1})
+            if not created:
+                cls.objects.filter(pk=counter).update(version=F('version') + 1)
+        return cls.current(counter)
+
+class PendingBuild(models.Model):
+    """ Build of a mapping waiting for its quiet period to end. There is
+        at most one per mapping, a newer revision replaces the queued one.
+    """
+
+    def __unicode__(self):
+        return "%s @ %s" % (self.revision, self.mapping)
+
+    def pending(self):
+        return self.due is not None
+    pending.boolean = True
+
+    mapping = models.ForeignKey(WebHookMapping, unique=True)
+    revision = models.CharField(max_length=250)
+    fields = models.TextField(help_text="JSON encoded workitem fields of the build")
+    due = models.DateTimeField(null=True, blank=True, db_index=True, help_text="when the build will be launched, empty if nothing is queued")
+    superseded = models.IntegerField(default=0, help_text="number of queued builds replaced by a newer revision")
+    launched = models.IntegerField(default=0)
+    last_launched = models.DateTimeField(null=True, blank=True)
+
+class Delivery(models.Model):
+    """ A handled webhook delivery, shared between webhook processes to
+        recognise redeliveries
+    """
+
+    def __unicode__(self):
+        return self.key
+
+    key = models.CharField(max_length=100, unique=True)
+    received = models.DateTimeField(auto_now_add=True, db_index=True)
+
+class QueuedEvent(models.Model):
+    """ A webhook payload accepted by the view and waiting for the
+        dispatcher to launch it
+    """
+
+    NEW = 'N'
+    RUNNING = 'R'
+    FAILED = 'F'
+    STATES = ((NEW, 'new'), (RUNNING, 'running'), (FAILED, 'failed'))
+
+    def __unicode__(self):
+        return "%s event for %s (%s)" % (self.provider, self.repourl, self.get_state_display())
+
+    provider = models.CharField(max_length=20)
+    repourl = models.CharField(max_length=200)
+    batch_key = models.CharField(max_length=250, blank=True, default="")
+    payload = models.TextField()
+    state = models.CharField(max_length=1, choices=STATES, default=NEW, db_index=True)
+    received = models.DateTimeField(auto_now_add=True)
+    claimed = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+
+class BuildBatch(models.Model):
+    """ Builds of many mappings triggered at once from the admin, launched
+        in the background at a bounded rate
+    """
+
+    def __unicode__(self):
+        return "%s builds triggered by %s" % (self.total, self.user)
+
+    def counts(self):
+        """ number of builds per state, in one query """
+
+        counts = dict((state, 0) for state, _ in BatchedBuild.STATES)
+        for state, count in self.batchedbuild_set.values_list('state').annotate(models.Count('id')):
+            counts[state] = count
+        return counts
+
+    user = models.ForeignKey(User)
+    created = models.DateTimeField(auto_now_add=True)
+    total = models.IntegerField(default=0)
+
+class BatchedBuild(models.Model):
+    """ One build of a BuildBatch """
+
+    NEW = 'N'
+    RUNNING = 'R'
+    LAUNCHED = 'L'
+    FAILED = 'F'
+    STATES = ((NEW, 'pending'), (RUNNING, 'launching'), (LAUNCHED, 'launched'), (FAILED, 'failed'))
+
+    def __unicode__(self):
+        return "%s (%s)" % (self.mapping, self.get_state_display())
+
+    batch = models.ForeignKey(BuildBatch)
+    mapping = models.ForeignKey(WebHookMapping)
+    state = models.CharField(max_length=1, choices=STATES, default=NEW, db_index=True)
+    claimed = models.DateTimeField(null=True, blank=True)
+    revision = models.CharField(max_length=250, blank=True, default="")
+    error = models.TextField(blank=True, default="")
 
 def default_perms(sender, **kwargs):
     if kwargs['created']:
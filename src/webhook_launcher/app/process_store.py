@@ -0,0 +1,80 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" cached process definitions """
+
+import os
+import threading
+
+class ProcessStore(object):
+    """ Reads process definitions once and keeps them in memory
+
+    A definition is read again only when the mtime, inode or size of
+    its file changes. Definitions can be overridden per build service
+    and per project by dropping a file with the same name in
+    <process_dir>/<namespace>/ or <process_dir>/<namespace>/<project>/
+    """
+
+    def __init__(self, process_dir=None):
+        self.process_dir = process_dir
+        self.lock = threading.Lock()
+        self.cache = {}
+
+    def read(self, path):
+        """ Contents of the process definition at path """
+
+        st = os.stat(path)
+        stamp = (st.st_mtime, st.st_ino, st.st_size)
+        with self.lock:
+            cached = self.cache.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        with open(path, mode='r') as process_file:
+            process = process_file.read()
+        with self.lock:
+            self.cache[path] = (stamp, process)
+        return process
+
+    def candidates(self, path, fields):
+        """ Override locations for the definition at path, most specific first """
+
+        if not self.process_dir or not fields:
+            return
+        namespace = fields.get('ev', {}).get('namespace')
+        if not namespace:
+            return
+        name = os.path.basename(path)
+        project = fields.get('project')
+        if project:
+            yield os.path.join(self.process_dir, namespace, project, name)
+        yield os.path.join(self.process_dir, namespace, name)
+
+    def get(self, path, fields=None):
+        """ Process definition for path, honouring overrides for fields
+
+        :param path: default process definition file
+        :param fields: workitem fields the process will be launched with
+        """
+
+        for candidate in self.candidates(path, fields):
+            try:
+                return self.read(candidate)
+            except (IOError, OSError):
+                continue
+        return self.read(path)
@@ -0,0 +1,191 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" on demand profiling of webhook POSTs """
+
+import cProfile
+import os
+import pstats
+import re
+import threading
+import time
+from collections import deque
+from StringIO import StringIO
+
+from django.conf import settings
+from django.db import connection
+
+PROFILE_HEADER = "HTTP_X_WEBHOOK_PROFILE"
+
+_NAME = re.compile(r'^[\w.-]+\.(prof|txt)$')
+
+class ProfileStore(object):
+    """ Directory keeping the newest keep profiles
+
+    Each profile is a .prof file with the cProfile stats, loadable with
+    pstats, and a .txt report with the slowest functions and the SQL
+    queries that ran.
+    """
+
+    def __init__(self, path, keep=50):
+        self.path = path
+        self.keep = keep
+
+    def save(self, label, profiler, queries, elapsed, status):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        now = time.time()
+        stem = "%s.%03d-%s-%s" % (time.strftime("%Y%m%d-%H%M%S", time.localtime(now)),
+                                  int(now * 1000) % 1000, os.getpid(),
+                                  re.sub(r'[^\w.-]+', '_', label)[:60])
+        profiler.dump_stats(os.path.join(self.path, stem + ".prof"))
+
+        report = StringIO()
+        report.write("%s\n%.1f ms, status %s, %s queries in %.1f ms\n\n" % (
+            label, elapsed * 1000, status, len(queries),
+            sum(float(query["time"]) for query in queries) * 1000))
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats("cumulative").print_stats(40)
+        report.write("\nSQL\n")
+        for query in queries:
+            report.write("%s ms  %s\n" % (query["time"], query["sql"]))
+        with open(os.path.join(self.path, stem + ".txt"), "w") as rfile:
+            rfile.write(report.getvalue())
+        self.rotate()
+        return stem
+
+    def rotate(self):
+        stems = sorted(name[:-5] for name in os.listdir(self.path) if name.endswith(".prof"))
+        for stem in stems[:max(len(stems) - self.keep, 0)]:
+            for ext in (".prof", ".txt"):
+                try:
+                    os.unlink(os.path.join(self.path, stem + ext))
+                except OSError:
+                    pass
+
+    def list(self):
+        """ (stem, modification time, .prof size) of stored profiles,
+            newest first
+        """
+
+        if not os.path.isdir(self.path):
+            return []
+        profiles = []
+        for name in os.listdir(self.path):
+            if name.endswith(".prof"):
+                stat = os.stat(os.path.join(self.path, name))
+                profiles.append((name[:-5], stat.st_mtime, stat.st_size))
+        profiles.sort(key=lambda profile: profile[0], reverse=True)
+        return profiles
+
+    def file(self, name):
+        """ Path of a stored file, None unless name is one """
+
+        if not _NAME.match(name):
+            return None
+        path = os.path.join(self.path, name)
+        if not os.path.isfile(path):
+            return None
+        return path
+
+class RateCap(object):
+    """ Allows at most limit events in any 60 seconds """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.times = deque()
+
+    def allow(self):
+        now = time.time()
+        with self.lock:
+            while self.times and now - self.times[0] > 60:
+                self.times.popleft()
+            if len(self.times) >= self.limit:
+                return False
+            self.times.append(now)
+            return True
+
+profiles = ProfileStore(settings.PROFILE_DIR, settings.PROFILE_KEEP)
+cap = RateCap(settings.PROFILE_MAX_PER_MINUTE)
+_local = threading.local()
+
+def _canonical(repourl):
+    repourl = repourl.strip().rstrip("/")
+    if repourl.endswith(".git"):
+        repourl = repourl[:-4]
+    return repourl
+
+def repo_label(repourl):
+    """ The profile_repos entry naming repourl, None if there is none """
+
+    if not settings.PROFILE:
+        return None
+    for repo in settings.PROFILE_REPOS:
+        if _canonical(repo) == _canonical(repourl):
+            return repo
+    return None
+
+def profile_call(label, func, *args, **kwargs):
+    """ Run func under cProfile and store the profile as label, unless
+        profile_max_per_minute is reached or a profile is already running
+    """
+
+    if getattr(_local, "active", False):
+        return func(*args, **kwargs)
+    if not cap.allow():
+        print "Not profiling webhook for %s, profile_max_per_minute reached" % label
+        return func(*args, **kwargs)
+
+    _local.active = True
+    use_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    first_query = len(connection.queries)
+    profiler = cProfile.Profile()
+    started = time.time()
+    status = 500
+    try:
+        result = profiler.runcall(func, *args, **kwargs)
+        status = getattr(result, "status_code", 200)
+        return result
+    finally:
+        elapsed = time.time() - started
+        queries = connection.queries[first_query:]
+        connection.use_debug_cursor = use_debug_cursor
+        _local.active = False
+        try:
+            stem = profiles.save(label, profiler, queries, elapsed, status)
+            print "Profiled webhook for %s as %s" % (label, stem)
+        except (IOError, OSError), exc:
+            print "Could not store webhook profile in %s: %s" % (profiles.path, exc)
+
+class ProfileMiddleware(object):
+    """ Profiles webhook POSTs asked for with the X-Webhook-Profile header.
+        POSTs for a repository listed in profile_repos are profiled by the
+        view, once it has checked the size and decoded the payload.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # the url conf imports the views as app.views
+        if request.method != 'POST' or view_func.__name__ != "index" or \
+           not view_func.__module__.endswith("app.views"):
+            return None
+        if not settings.PROFILE_SECRET or \
+           request.META.get(PROFILE_HEADER) != settings.PROFILE_SECRET:
+            return None
+        return profile_call("header", view_func, request, *view_args, **view_kwargs)
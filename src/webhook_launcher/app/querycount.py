@@ -0,0 +1,114 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" counting of the SQL queries made by a request or workitem
+
+  with count_queries() as counted:
+      mapobj.delete()
+  print "%s queries in %.1f ms" % (counted.count, counted.seconds * 1000)
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.backends import util
+
+logger = logging.getLogger("webhook_launcher.queries")
+
+class CountingCursor(util.CursorWrapper):
+    """ Cursor adding every statement to the counters active on its
+        connection
+    """
+
+    def _counted(self, method, *args):
+        started = time.time()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.time() - started
+            for counter in self.db._query_counters:
+                counter.count += 1
+                counter.seconds += elapsed
+
+    def execute(self, sql, params=()):
+        return self._counted(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._counted(self.cursor.executemany, sql, param_list)
+
+class count_queries(object):
+    """ Context manager counting the queries made on connection inside it
+
+    Statements are counted as they are executed by a cursor wrapper, so
+    the count holds even when connection.queries is reset inside, as
+    the test client does for every request, and nothing accumulates
+    when DEBUG is off. Counters can be nested.
+    """
+
+    def __init__(self, conn=None):
+        self.connection = conn or connections[DEFAULT_DB_ALIAS]
+        self.count = 0
+        self.seconds = 0.0
+
+    def __enter__(self):
+        conn = self.connection
+        counters = getattr(conn, "_query_counters", None)
+        if not counters:
+            conn._query_counters = counters = []
+            # connection.cursor() only asks for a debug cursor when one
+            # is wanted, make it always ask and decide here
+            debug = conn.use_debug_cursor or (conn.use_debug_cursor is None and settings.DEBUG)
+            conn._counted_use_debug_cursor = conn.use_debug_cursor
+            make_debug_cursor = conn.make_debug_cursor
+
+            def counting_cursor(cursor):
+                if debug:
+                    return CountingCursor(make_debug_cursor(cursor), conn)
+                return CountingCursor(util.CursorWrapper(cursor, conn), conn)
+            conn.make_debug_cursor = counting_cursor
+            conn.use_debug_cursor = True
+        counters.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        conn = self.connection
+        conn._query_counters.remove(self)
+        if not conn._query_counters:
+            del conn.make_debug_cursor
+            conn.use_debug_cursor = conn._counted_use_debug_cursor
+        return False
+
+class QueryCountMiddleware(object):
+    """ Logs the query count and SQL time of every request """
+
+    def process_request(self, request):
+        request._counted_queries = count_queries().__enter__()
+        request._counted_started = time.time()
+
+    def process_response(self, request, response):
+        counted = getattr(request, "_counted_queries", None)
+        if counted is None:
+            # an earlier middleware answered before process_request
+            return response
+        counted.__exit__(None, None, None)
+        logger.info("%s %s %s: %s queries, %.1f ms SQL, %.1f ms total" % (
+            request.method, request.path, response.status_code, counted.count,
+            counted.seconds * 1000, (time.time() - request._counted_started) * 1000))
+        return response
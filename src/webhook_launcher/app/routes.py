@@ -0,0 +1,218 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" in memory (repourl, branch) -> mapping routing index """
+
+import datetime
+import threading
+import time
+import urlparse
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+
+from webhook_launcher.app.models import WebHookMapping, LastSeenRevision, BuildService, RouteVersion
+
+# seconds a revision reload reaches back before the previous one, so
+# that rows committed late or stamped by a host whose clock lags are
+# not missed
+REVISION_OVERLAP = 60
+
+def normalize_repourl(repourl):
+    """ Canonical form of a repository url used as routing key """
+
+    url = urlparse.urlsplit(repourl.strip())
+    path = url.path.rstrip("/")
+    return urlparse.urlunsplit((url.scheme.lower(), url.netloc.lower(),
+                                path, url.query, ""))
+
+class Route(object):
+    """ What the webhook path needs to know about one mapping """
+
+    __slots__ = ('id', 'repourl', 'branch', 'project', 'package',
+                 'notify', 'build', 'namespace', 'revision')
+
+    def __init__(self, id, repourl, branch, project, package, notify, build,
+                 namespace, revision=None):
+        self.id = id
+        self.repourl = repourl
+        self.branch = branch
+        self.project = project
+        self.package = package
+        self.notify = notify
+        self.build = build
+        self.namespace = namespace
+        self.revision = revision
+
+    def needs_action(self, revision, tag=False, branches=True):
+        """ Whether an event for revision would record or launch anything
+
+        :param revision: revision the event points at
+        :param tag: True if the mapping would be handled as a tag
+        :param branches: False for annotated tags, which are only handled
+                         when their revision was already seen
+        """
+
+        if self.revision != revision:
+            return branches
+        if tag:
+            return bool(self.notify or (self.build and self.project and self.package))
+        return bool(self.notify)
+
+    def __repr__(self):
+        return "<Route %s %s/%s -> %s/%s>" % (self.id, self.repourl, self.branch,
+                                             self.project, self.package)
+
+class RouteTable(object):
+    """ Compiled index of all mappings: repourl -> branch -> routes
+
+    The table is rebuilt lazily after a local change to a mapping or
+    build service. Changes made by other processes are noticed through
+    the RouteVersion counters, which are read at most every
+    check_interval seconds; in between lookups cost no queries. New last
+    seen revisions only bump the REVISIONS counter, on which the other
+    processes reload the revisions changed since their previous load
+    but keep the rest of the table.
+    """
+
+    def __init__(self, check_interval=None):
+        if check_interval is None:
+            check_interval = settings.ROUTE_CHECK_INTERVAL
+        self.check_interval = check_interval
+        self.lock = threading.RLock()
+        self.routes = None
+        self.by_id = {}
+        self.version = None
+        self.revisions_version = None
+        self.revisions_loaded = None
+        self.checked = 0
+
+    def _build(self):
+        self.revisions_loaded = datetime.datetime.now()
+        revisions = dict(LastSeenRevision.objects.values_list('mapping_id', 'revision'))
+        routes = {}
+        by_id = {}
+        rows = WebHookMapping.objects.values_list('id', 'repourl', 'branch', 'project',
+                                                  'package', 'notify', 'build',
+                                                  'obs__namespace')
+        for row in rows:
+            route = Route(*row, revision=revisions.get(row[0]))
+            branches = routes.setdefault(normalize_repourl(route.repourl), {})
+            branches.setdefault(route.branch, []).append(route)
+            by_id[route.id] = route
+        self.routes = routes
+        self.by_id = by_id
+
+    def _reload_revisions(self):
+        """ Load the revisions updated since the previous load. Deleted
+            ones need no care, their deletion invalidates the table
+        """
+
+        since = self.revisions_loaded - datetime.timedelta(seconds=REVISION_OVERLAP)
+        self.revisions_loaded = datetime.datetime.now()
+        rows = LastSeenRevision.objects.filter(updated__gte=since)
+        for mapping_id, revision in rows.values_list('mapping_id', 'revision'):
+            route = self.by_id.get(mapping_id)
+            if route is not None:
+                route.revision = revision
+
+    def _fresh(self, force=False):
+        """ Make sure the table is current, must hold the lock """
+
+        now = time.time()
+        if not force and self.routes is not None and now - self.checked < self.check_interval:
+            return
+        versions = RouteVersion.currents(RouteVersion.ROUTES, RouteVersion.REVISIONS)
+        self.checked = now
+        if self.routes is None or versions[RouteVersion.ROUTES] != self.version:
+            self.version = versions[RouteVersion.ROUTES]
+            self.revisions_version = versions[RouteVersion.REVISIONS]
+            self._build()
+        elif versions[RouteVersion.REVISIONS] != self.revisions_version:
+            self.revisions_version = versions[RouteVersion.REVISIONS]
+            self._reload_revisions()
+
+    def lookup(self, repourl, branches=None, force=False):
+        """ Routes for repourl, limited to branches if given. force checks
+            for changes of other processes even within check_interval
+        """
+
+        with self.lock:
+            self._fresh(force)
+            repo = self.routes.get(normalize_repourl(repourl), {})
+            if branches:
+                found = []
+                for branch in branches:
+                    found.extend(repo.get(branch, []))
+                return found
+            return [route for routes in repo.values() for route in routes]
+
+    def invalidate(self):
+        """ Drop the local table and tell the other processes to do so """
+
+        with self.lock:
+            self.routes = None
+            self.by_id = {}
+        RouteVersion.bump()
+
+    def seen(self, mapping_ids, revision):
+        """ Record a new last seen revision without a rebuild, the other
+            processes only reload the revisions
+        """
+
+        with self.lock:
+            updated = False
+            if self.routes is not None:
+                for mapping_id in mapping_ids:
+                    route = self.by_id.get(mapping_id)
+                    if route is not None:
+                        route.revision = revision
+                        updated = True
+            current = self.revisions_version
+        version = RouteVersion.bump(RouteVersion.REVISIONS)
+        # this process is already current unless somebody else recorded
+        # revisions meanwhile
+        with self.lock:
+            if updated and self.revisions_version == current and version == current + 1:
+                self.revisions_version = version
+
+route_table = RouteTable()
+
+def _mapping_changed(sender, **kwargs):
+    route_table.invalidate()
+
+def _listing_changed(sender, **kwargs):
+    RouteVersion.bump(RouteVersion.LISTING)
+
+def _revision_saved(sender, **kwargs):
+    lsr = kwargs['instance']
+    route_table.seen([lsr.mapping_id], lsr.revision)
+
+for _sender in (WebHookMapping, BuildService):
+    post_save.connect(_mapping_changed, sender=_sender, weak=False,
+                      dispatch_uid="routes_save_%s" % _sender.__name__)
+    post_delete.connect(_mapping_changed, sender=_sender, weak=False,
+                        dispatch_uid="routes_delete_%s" % _sender.__name__)
+post_save.connect(_listing_changed, sender=WebHookMapping, weak=False,
+                  dispatch_uid="listing_save_WebHookMapping")
+post_delete.connect(_listing_changed, sender=WebHookMapping, weak=False,
+                    dispatch_uid="listing_delete_WebHookMapping")
+post_save.connect(_revision_saved, sender=LastSeenRevision, weak=False,
+                  dispatch_uid="routes_save_LastSeenRevision")
+post_delete.connect(_mapping_changed, sender=LastSeenRevision, weak=False,
+                    dispatch_uid="routes_delete_LastSeenRevision")
@@ -0,0 +1,63 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" process start up hooks for multi process deployments """
+
+import time
+import traceback
+
+from django.conf import settings
+from django.db import connections
+
+def warm_up():
+    """ Build the route table and load the process definitions, so the
+        first webhook of each worker doesn't pay for it
+    """
+
+    from webhook_launcher.app.utils import process_store
+    from webhook_launcher.app.routes import route_table
+
+    started = time.time()
+    try:
+        route_table.lookup("")
+        for path in (settings.VCSCOMMIT_NOTIFY, settings.VCSCOMMIT_BUILD):
+            process_store.get(path)
+    except Exception:
+        # a cold cache is no reason not to start
+        traceback.print_exc()
+    finally:
+        close_connections()
+    print "warmed up in %.3fs" % (time.time() - started)
+
+def close_connections():
+    for connection in connections.all():
+        connection.close()
+
+def after_fork():
+    """ Sockets must not be shared between a parent and its children.
+        Threads don't survive a fork, so each worker watches for batches
+        left behind by the one it replaces.
+    """
+
+    from webhook_launcher.app.utils import launcher_pool, api_client
+    from webhook_launcher.app.batches import start_batch_watcher
+
+    close_connections()
+    launcher_pool.close()
+    api_client.close()
+    start_batch_watcher()
@@ -0,0 +1,37 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" tests of the webhook app, run with
+
+  django-admin test app --settings=webhook_launcher.settings
+"""
+
+from webhook_launcher.app.tests.test_batches import *
+from webhook_launcher.app.tests.test_bitbucket import *
+from webhook_launcher.app.tests.test_dedup import *
+from webhook_launcher.app.tests.test_dispatcher import *
+from webhook_launcher.app.tests.test_http_client import *
+from webhook_launcher.app.tests.test_ipfilter import *
+from webhook_launcher.app.tests.test_launcher_pool import *
+from webhook_launcher.app.tests.test_pending_builds import *
+from webhook_launcher.app.tests.test_placeholders import *
+from webhook_launcher.app.tests.test_profiling import *
+from webhook_launcher.app.tests.test_query_budgets import *
+from webhook_launcher.app.tests.test_querycount import *
+from webhook_launcher.app.tests.test_routes import *
+from webhook_launcher.app.tests.test_triage import *
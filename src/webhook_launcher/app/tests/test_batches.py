@@ -0,0 +1,54 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from webhook_launcher.app import loadtest
+from webhook_launcher.app.batches import orphaned_batches, queue_batch, requeue_stale_builds
+from webhook_launcher.app.models import BuildBatch, BatchedBuild, WebHookMapping
+
+class OrphanedBatchTest(TestCase):
+
+    def setUp(self):
+        loadtest.create_fixtures([("https://github.com/example/project.git", "master")], 3)
+        self.batch = queue_batch(WebHookMapping.objects.all(), User.objects.get(pk=1))
+        self.long_ago = datetime.datetime.now() - datetime.timedelta(days=1)
+
+    def test_new_batch(self):
+        # its runner may not have claimed anything yet
+        self.assertEqual(orphaned_batches(), [])
+
+    def test_abandoned(self):
+        BuildBatch.objects.filter(pk=self.batch.pk).update(created=self.long_ago)
+        # the runner went away with two builds claimed
+        claimed = BatchedBuild.objects.filter(batch=self.batch).order_by('id')[:2]
+        BatchedBuild.objects.filter(pk__in=[build.pk for build in claimed]).update(
+            state=BatchedBuild.RUNNING, claimed=self.long_ago)
+        self.assertEqual(orphaned_batches(), [self.batch])
+        self.assertEqual(requeue_stale_builds(), 2)
+        self.assertEqual(self.batch.counts()[BatchedBuild.NEW], 3)
+
+    def test_still_claiming(self):
+        BuildBatch.objects.filter(pk=self.batch.pk).update(created=self.long_ago)
+        build = BatchedBuild.objects.filter(batch=self.batch)[0]
+        BatchedBuild.objects.filter(pk=build.pk).update(state=BatchedBuild.LAUNCHED,
+                                                        claimed=datetime.datetime.now())
+        self.assertEqual(orphaned_batches(), [])
@@ -0,0 +1,37 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from django.test import TestCase
+
+from webhook_launcher.app.utils import tagged_tips
+
+class TaggedTipsTest(TestCase):
+
+    def test_tagged_heads(self):
+        response = { "branches" : [{ "name" : "master", "changeset" : "a" },
+                                   { "name" : "devel", "changeset" : "b" },
+                                   { "name" : "old", "changeset" : "c" }],
+                     "tags" : [{ "name" : "1.0", "changeset" : "a" },
+                               { "name" : "1.0.1", "changeset" : "a" },
+                               { "name" : "0.9", "changeset" : "d" },
+                               { "name" : "2.0-rc", "changeset" : "c" }] }
+        self.assertEqual(tagged_tips(response), { "master" : "a", "old" : "c" })
+
+    def test_no_tags(self):
+        response = { "branches" : [{ "name" : "master", "changeset" : "a" }], "tags" : [] }
+        self.assertEqual(tagged_tips(response), {})
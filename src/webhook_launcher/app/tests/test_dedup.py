@@ -0,0 +1,71 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from webhook_launcher.app.dedup import DeliveryCache, delivery_key
+from webhook_launcher.app.models import Delivery
+
+class DeliveryKeyTest(TestCase):
+
+    def test_provider_id(self):
+        request = RequestFactory().post("/", HTTP_X_GITHUB_DELIVERY="abc")
+        self.assertEqual(delivery_key(request), "github_delivery:abc")
+
+    def test_no_id(self):
+        # identical bodies of separate pushes must not collapse
+        request = RequestFactory().post("/", '{"commits": []}',
+                                        content_type="application/json")
+        self.assertEqual(delivery_key(request), None)
+
+class DeliveryCacheTest(TestCase):
+
+    def test_claim_once(self):
+        cache = DeliveryCache(ttl=60)
+        self.assertTrue(cache.claim("a"))
+        # a retry while the first attempt still runs
+        self.assertFalse(cache.claim("a"))
+        self.assertTrue(cache.claim("b"))
+
+    def test_release(self):
+        cache = DeliveryCache(ttl=60)
+        self.assertTrue(cache.claim("a"))
+        cache.release("a")
+        self.assertTrue(cache.claim("a"))
+
+    def test_expiry(self):
+        cache = DeliveryCache(ttl=0)
+        self.assertTrue(cache.claim("a"))
+        cache.keys["a"] -= 1
+        self.assertTrue(cache.claim("a"))
+
+    def test_size(self):
+        cache = DeliveryCache(size=2, ttl=60)
+        for key in ("a", "b", "c"):
+            cache.claim(key)
+        self.assertEqual(list(cache.keys), ["b", "c"])
+
+    def test_shared_through_db(self):
+        first = DeliveryCache(ttl=60, use_db=True)
+        second = DeliveryCache(ttl=60, use_db=True)
+        self.assertTrue(first.claim("a"))
+        self.assertFalse(second.claim("a"))
+        first.release("a")
+        self.assertFalse(Delivery.objects.filter(key="a").exists())
+        self.assertTrue(DeliveryCache(ttl=60, use_db=True).claim("a"))
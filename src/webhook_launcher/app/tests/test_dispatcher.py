@@ -0,0 +1,71 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import copy
+import json
+import os
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from webhook_launcher.app import loadtest
+from webhook_launcher.app.dispatcher import run_events
+from webhook_launcher.app.launcher_pool import RecordingLauncher
+from webhook_launcher.app.models import QueuedEvent
+from webhook_launcher.app.utils import launcher_pool
+
+PROCESSES = os.path.join(settings.PROJECT_DIR, "processes")
+
+@override_settings(VCSCOMMIT_NOTIFY=os.path.join(PROCESSES, "VCSCOMMIT_NOTIFY"),
+                   VCSCOMMIT_BUILD=os.path.join(PROCESSES, "VCSCOMMIT_BUILD"),
+                   BUILD_QUIET_PERIOD=0)
+class RunEventsTest(TestCase):
+
+    def setUp(self):
+        launcher_pool.close()
+        self.launcher_class = launcher_pool.launcher_class
+        launcher_pool.launcher_class = RecordingLauncher
+        RecordingLauncher.reset()
+        self.payload = loadtest.load_corpus()["github_push"]["payload"]
+        self.repourl = self.payload["repository"]["url"] + ".git"
+        loadtest.create_fixtures([(self.repourl, "master")], 1)
+
+    def tearDown(self):
+        launcher_pool.close()
+        launcher_pool.launcher_class = self.launcher_class
+        RecordingLauncher.reset()
+
+    def queue(self, payload):
+        return QueuedEvent.objects.create(provider="github", repourl=self.repourl,
+                                          payload=json.dumps(payload), batch_key="push")
+
+    def test_failed_event_alone(self):
+        push = copy.deepcopy(self.payload)
+        push["ref"] = "refs/heads/master"
+        broken = copy.deepcopy(push)
+        del broken["ref"]
+        events = [self.queue(push), self.queue(broken)]
+
+        self.assertEqual(run_events(events), 1)
+        # the first push recorded its revision, so it must be launched now
+        self.assertEqual(RecordingLauncher.reset().get("notify"), 1)
+        self.assertFalse(QueuedEvent.objects.filter(pk=events[0].pk).exists())
+        failed = QueuedEvent.objects.get(pk=events[1].pk)
+        self.assertEqual((failed.state, failed.attempts), (QueuedEvent.FAILED, 1))
+        self.assertTrue("KeyError" in failed.error)
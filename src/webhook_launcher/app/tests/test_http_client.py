@@ -0,0 +1,99 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import json
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from django.test import TestCase
+
+from webhook_launcher.app.http_client import HTTPClient, HTTPError
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Serves server.documents by path, with an ETag per version """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match"),
+                                     self.client_address[1]))
+        if self.path not in self.server.documents:
+            self.reply(500, "")
+            return
+        version, data = self.server.documents[self.path]
+        etag = '"%s"' % version
+        if self.headers.get("If-None-Match") == etag:
+            self.reply(304, "", etag)
+        else:
+            self.reply(200, json.dumps(data), etag)
+
+    def reply(self, status, body, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class HTTPClientTest(TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.documents = { "/tags" : (1, { "tags" : ["1.0"] }) }
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:%s" % self.server.server_port
+        self.client = HTTPClient(connect_timeout=2, timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_revalidated_every_call(self):
+        self.assertEqual(self.client.get_json(self.url + "/tags", ttl=0), { "tags" : ["1.0"] })
+        self.assertEqual(self.client.get_json(self.url + "/tags", ttl=0), { "tags" : ["1.0"] })
+        self.assertEqual([etag for path, etag, port in self.server.requests], [None, '"1"'])
+        # a new tag is seen right away
+        self.server.documents["/tags"] = (2, { "tags" : ["1.0", "1.1"] })
+        self.assertEqual(self.client.get_json(self.url + "/tags", ttl=0),
+                         { "tags" : ["1.0", "1.1"] })
+
+    def test_ttl(self):
+        self.client.get_json(self.url + "/tags", ttl=60)
+        self.server.documents["/tags"] = (2, { "tags" : [] })
+        self.assertEqual(self.client.get_json(self.url + "/tags", ttl=60), { "tags" : ["1.0"] })
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_not_cached(self):
+        self.client.get_json(self.url + "/tags")
+        self.client.get_json(self.url + "/tags")
+        self.assertEqual([etag for path, etag, port in self.server.requests], [None, None])
+
+    def test_connection_kept_alive(self):
+        for i in range(3):
+            self.client.get_json(self.url + "/tags")
+        self.assertEqual(len(set(port for path, etag, port in self.server.requests)), 1)
+
+    def test_error(self):
+        self.assertRaises(HTTPError, self.client.get_json, self.url + "/missing")
@@ -0,0 +1,64 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from webhook_launcher.ipfilter import NetworkMatcher
+
+class NetworkMatcherTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "networks")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, content, mtime):
+        with open(self.path, "w") as netfile:
+            netfile.write(content)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_match(self):
+        matcher = NetworkMatcher(["192.30.252.0/22", "2620:112:3000::/44", "10.0.0.1"])
+        self.assertTrue("192.30.253.10" in matcher)
+        self.assertTrue("::ffff:192.30.252.1" in matcher)
+        self.assertTrue("2620:112:3001::1" in matcher)
+        self.assertTrue("10.0.0.1" in matcher)
+        self.assertFalse("10.0.0.2" in matcher)
+        self.assertFalse("not an address" in matcher)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, NetworkMatcher, ["10.0.0.0/33"])
+        self.write("10.0.0.0/8\nnonsense\n", 1000)
+        self.assertRaises(ValueError, NetworkMatcher, path=self.path)
+        self.assertRaises(ValueError, NetworkMatcher, path=self.path + ".missing")
+
+    def test_reload(self):
+        self.write("10.0.0.0/8\n", 1000)
+        matcher = NetworkMatcher(path=self.path, check_interval=0)
+        self.write('{"hooks": ["192.168.0.0/16"]}', 2000)
+        self.assertTrue("192.168.1.1" in matcher)
+        self.assertFalse("10.1.1.1" in matcher)
+        # a broken file keeps the previous networks
+        self.write("192.168.0.0/16, 300.1.1.1", 3000)
+        self.assertTrue("192.168.1.1" in matcher)
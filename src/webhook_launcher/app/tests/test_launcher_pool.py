@@ -0,0 +1,73 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from django.test import TestCase
+
+from webhook_launcher.app.launcher_pool import LauncherPool
+
+class Connection(object):
+
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+class FlakyLauncher(object):
+    """ Fails the launches listed in fail, by launch number """
+
+    fail = set()
+    launches = []
+
+    def __init__(self, **kwargs):
+        self.conn = Connection()
+
+    def launch(self, process, fields):
+        number = len(FlakyLauncher.launches)
+        FlakyLauncher.launches.append((self, process))
+        if number in FlakyLauncher.fail:
+            raise IOError("connection reset")
+
+class LauncherPoolTest(TestCase):
+
+    def setUp(self):
+        FlakyLauncher.fail = set()
+        FlakyLauncher.launches = []
+        self.pool = LauncherPool(launcher_class=FlakyLauncher)
+
+    def launch(self):
+        self.pool.launch("host", "user", "pass", "vhost", "process", {})
+
+    def test_reused(self):
+        for i in range(3):
+            self.launch()
+        self.assertEqual(self.pool.connects, 1)
+
+    def test_retried_on_a_new_connection(self):
+        self.launch()
+        FlakyLauncher.fail = set([1])
+        self.launch()
+        first, failed, retried = [launcher for launcher, process in FlakyLauncher.launches]
+        self.assertTrue(first is failed and failed.conn.closed)
+        self.assertTrue(retried is not failed)
+        self.assertEqual(self.pool.connects, 2)
+
+    def test_failure(self):
+        FlakyLauncher.fail = set([0, 1])
+        self.assertRaises(IOError, self.launch)
+        self.launch()
+        self.assertEqual(self.pool.connects, 3)
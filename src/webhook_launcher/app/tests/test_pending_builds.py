@@ -0,0 +1,46 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from webhook_launcher.app import loadtest
+from webhook_launcher.app.models import PendingBuild, WebHookMapping
+from webhook_launcher.app.utils import schedule_build
+
+@override_settings(BUILD_QUIET_PERIOD=60)
+class ScheduleBuildTest(TestCase):
+
+    def setUp(self):
+        loadtest.create_fixtures([("https://github.com/example/project.git", "master")], 1)
+        self.mapobj = WebHookMapping.objects.get()
+
+    def schedule(self, revision):
+        schedule_build(self.mapobj, { "revision" : revision })
+        return PendingBuild.objects.get(mapping=self.mapobj)
+
+    def test_superseded(self):
+        self.schedule("a")
+        pending = self.schedule("b")
+        self.assertEqual((pending.revision, pending.superseded), ("b", 1))
+
+    def test_same_revision(self):
+        first = self.schedule("a")
+        pending = self.schedule("a")
+        self.assertEqual((pending.revision, pending.superseded), ("a", 0))
+        self.assertTrue(pending.due >= first.due)
@@ -0,0 +1,59 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from webhook_launcher.app import loadtest
+from webhook_launcher.app.models import BuildService, WebHookMapping
+from webhook_launcher.app.querycount import count_queries
+from webhook_launcher.app.routes import route_table
+from webhook_launcher.app.utils import create_placeholder, github_webhook_launch
+
+REPO = "https://github.com/example/repo.git"
+
+class PlaceholderTest(TestCase):
+
+    def setUp(self):
+        User.objects.create(id=1, username="test")
+        BuildService.objects.create(namespace="test", apiurl="https://api.test.invalid")
+        self.default_project = settings.DEFAULT_PROJECT
+        settings.DEFAULT_PROJECT = "test:placeholders"
+
+    def tearDown(self):
+        settings.DEFAULT_PROJECT = self.default_project
+
+    def test_created_once(self):
+        # the second call stands for a process whose route table is stale
+        first = create_placeholder(REPO, "master")
+        second = create_placeholder(REPO, "master")
+        self.assertEqual([mapobj.id for mapobj in first], [mapobj.id for mapobj in second])
+        self.assertEqual(WebHookMapping.objects.filter(repourl=REPO, branch="master").count(), 1)
+
+    def test_unmapped_without_default_project(self):
+        settings.DEFAULT_PROJECT = ""
+        payload = loadtest.load_corpus()["github_push"]["payload"]
+        payload["ref"] = "refs/heads/unmapped"
+        route_table.lookup(REPO)
+        with count_queries() as counted:
+            self.assertEqual(create_placeholder(REPO, "unmapped"), [])
+            github_webhook_launch(REPO, payload)
+        self.assertEqual(counted.count, 0)
+        self.assertFalse(WebHookMapping.objects.exists())
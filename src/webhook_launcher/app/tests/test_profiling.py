@@ -0,0 +1,69 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import json
+import os
+import shutil
+import tempfile
+import urllib
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+
+from webhook_launcher.app import loadtest, profiling
+
+REPO = "https://bitbucket.org/example/project"
+
+@override_settings(PROFILE=True, PROFILE_REPOS=[REPO], ASYNC_DISPATCH=True,
+                   POST_IP_FILTER=False, MAX_PAYLOAD_BYTES=100000)
+class ProfileReposTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.profiles = profiling.profiles
+        profiling.profiles = profiling.ProfileStore(self.path)
+        self.payload = loadtest.load_corpus()["bitbucket_push"]["payload"]
+        self.url = "/%s/" % settings.URL_PREFIX
+
+    def tearDown(self):
+        profiling.profiles = self.profiles
+        shutil.rmtree(self.path)
+
+    def profiled(self):
+        return [name for name in os.listdir(self.path) if name.endswith(".prof")]
+
+    def test_repo_label(self):
+        self.assertEqual(profiling.repo_label(REPO + ".git"), REPO)
+        self.assertEqual(profiling.repo_label(REPO + "/"), REPO)
+        self.assertEqual(profiling.repo_label(REPO + "-other.git"), None)
+
+    def test_form_encoded(self):
+        # how bitbucket posts
+        response = Client().post(self.url, urllib.urlencode({ "payload" : json.dumps(self.payload) }),
+                                 content_type="application/x-www-form-urlencoded")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(self.profiled()), 1)
+
+    def test_too_large(self):
+        self.payload["padding"] = REPO * 10000
+        response = Client().post(self.url, json.dumps(self.payload),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.profiled(), [])
@@ -0,0 +1,104 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+""" pinned query budgets of the webhook path
+
+The budgets are queries per event, replayed against 1, 10 and 1000
+mappings per branch. A change that adds queries to the webhook path, or
+makes them grow with the number of mappings, has to update them here.
+"""
+
+import os
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from webhook_launcher.app import loadtest
+from webhook_launcher.app.launcher_pool import RecordingLauncher
+from webhook_launcher.app.utils import launcher_pool
+
+PROCESSES = os.path.join(settings.PROJECT_DIR, "processes")
+
+# a tag costs the same however many mappings its branch has
+TAG_QUERY_BUDGET = 2
+
+# queries per event of each scenario, per number of mappings per branch.
+# deletes and bulk inserts are chunked, so those grow slowly
+QUERY_BUDGETS = {
+    1 : { "push" : 7, "large-push" : 5, "delete" : 9, "bitbucket-push" : 8,
+          "tag-burst" : TAG_QUERY_BUDGET, "annotated-tag" : TAG_QUERY_BUDGET },
+    10 : { "push" : 7, "large-push" : 5, "delete" : 9, "bitbucket-push" : 8,
+           "tag-burst" : TAG_QUERY_BUDGET, "annotated-tag" : TAG_QUERY_BUDGET },
+    1000 : { "push" : 8, "large-push" : 6, "delete" : 21, "bitbucket-push" : 9,
+             "tag-burst" : TAG_QUERY_BUDGET, "annotated-tag" : TAG_QUERY_BUDGET },
+}
+
+@override_settings(VCSCOMMIT_NOTIFY=os.path.join(PROCESSES, "VCSCOMMIT_NOTIFY"),
+                   VCSCOMMIT_BUILD=os.path.join(PROCESSES, "VCSCOMMIT_BUILD"),
+                   ASYNC_DISPATCH=False, BUILD_QUIET_PERIOD=0, POST_IP_FILTER=False,
+                   DEFAULT_PROJECT="")
+class QueryBudgetTest(TestCase):
+    """ Replays every scenario against count mappings per branch """
+
+    count = 1
+    rounds = 3
+
+    def setUp(self):
+        launcher_pool.close()
+        self.launcher_class = launcher_pool.launcher_class
+        launcher_pool.launcher_class = RecordingLauncher
+        RecordingLauncher.reset()
+
+    def tearDown(self):
+        launcher_pool.close()
+        launcher_pool.launcher_class = self.launcher_class
+        RecordingLauncher.reset()
+
+    def replay(self, scenarios):
+        corpus = loadtest.Corpus(scenarios, commits=50, tags=5)
+        events = []
+        for number in range(self.rounds):
+            events.extend(corpus.round(number))
+        loadtest.create_fixtures(corpus.branches, self.count)
+        result = loadtest.Result()
+        loadtest.ClientReplayer().replay(events, result)
+        summary = result.summary()
+        self.assertEqual(summary["statuses"].keys(), ["200"])
+        return summary
+
+    def test_budgets(self):
+        summary = self.replay(loadtest.SCENARIOS)
+        self.assertEqual(loadtest.over_budget(summary, QUERY_BUDGETS[self.count]), [])
+        launches = RecordingLauncher.reset()
+        self.assertTrue(launches.get("notify") and launches.get("build"))
+
+    def test_tags(self):
+        # pushes first, so the tagged branches have been seen
+        summary = self.replay(("push", "tag-burst", "annotated-tag"))
+        self.assertEqual(loadtest.over_budget(summary, { "tag-burst" : TAG_QUERY_BUDGET,
+                                                         "annotated-tag" : TAG_QUERY_BUDGET }), [])
+        # every mapping of the tagged branch is built
+        self.assertTrue(RecordingLauncher.reset().get("build") >= self.count)
+
+class QueryBudgetTenTest(QueryBudgetTest):
+    count = 10
+
+class QueryBudgetThousandTest(QueryBudgetTest):
+    count = 1000
@@ -0,0 +1,59 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+from django.contrib.auth.models import User
+from django.db import connection, reset_queries
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from webhook_launcher.app.querycount import count_queries
+
+class CountQueriesTest(TestCase):
+
+    def test_count(self):
+        with count_queries() as counted:
+            User.objects.count()
+            User.objects.filter(username="nobody").exists()
+        self.assertEqual(counted.count, 2)
+
+    def test_reset_inside(self):
+        # the test client resets the queries at the start of each request
+        with count_queries() as counted:
+            User.objects.count()
+            reset_queries()
+            User.objects.count()
+        self.assertEqual(counted.count, 2)
+
+    def test_nested(self):
+        with count_queries() as outer:
+            User.objects.count()
+            with count_queries() as inner:
+                User.objects.count()
+        self.assertEqual((outer.count, inner.count), (2, 1))
+
+    @override_settings(DEBUG=False)
+    def test_restores_connection(self):
+        use_debug_cursor = connection.use_debug_cursor
+        queries = len(connection.queries)
+        with count_queries():
+            User.objects.count()
+        self.assertEqual(connection.use_debug_cursor, use_debug_cursor)
+        self.assertFalse("make_debug_cursor" in connection.__dict__)
+        # with DEBUG off nothing was recorded for counting
+        self.assertEqual(len(connection.queries), queries)
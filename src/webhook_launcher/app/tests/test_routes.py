@@ -0,0 +1,84 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from webhook_launcher.app.models import BuildService, LastSeenRevision, WebHookMapping
+from webhook_launcher.app.routes import RouteTable, REVISION_OVERLAP
+from webhook_launcher.app.utils import record_revision
+
+REPO = "https://github.com/example/repo.git"
+
+class RouteTableTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="test")
+        self.obs = BuildService.objects.create(namespace="test", apiurl="https://api.test.invalid")
+        self.mapping = WebHookMapping.objects.create(repourl=REPO, branch="master",
+                                                     project="test", package="repo",
+                                                     user=self.user, obs=self.obs)
+        # two processes that only check for changes when asked to
+        self.first = RouteTable(check_interval=3600)
+        self.second = RouteTable(check_interval=3600)
+
+    def test_lookup(self):
+        routes = self.first.lookup(REPO + "/", ["master"])
+        self.assertEqual([route.id for route in routes], [self.mapping.id])
+        self.assertEqual(self.first.lookup(REPO, ["other"]), [])
+
+    def test_new_mapping_of_other_process(self):
+        self.second.lookup(REPO)
+        other = WebHookMapping.objects.create(repourl=REPO, branch="devel",
+                                              project="test", package="repo-devel",
+                                              user=self.user, obs=self.obs)
+        self.assertEqual(self.second.lookup(REPO, ["devel"]), [])
+        routes = self.second.lookup(REPO, ["devel"], force=True)
+        self.assertEqual([route.id for route in routes], [other.id])
+
+    def test_revision_reload_keeps_table(self):
+        self.first.lookup(REPO)
+        self.second.lookup(REPO)
+        table = self.second.routes
+        LastSeenRevision.objects.create(mapping=self.mapping, revision="abc")
+        self.first.seen([self.mapping.id], "abc")
+        routes = self.second.lookup(REPO, ["master"], force=True)
+        # revisions are reloaded, the table isn't rebuilt
+        self.assertTrue(self.second.routes is table)
+        self.assertEqual(routes[0].revision, "abc")
+        self.assertEqual(self.first.lookup(REPO, ["master"])[0].revision, "abc")
+
+    def test_revision_reload_reads_updated_rows(self):
+        other = WebHookMapping.objects.create(repourl=REPO, branch="devel",
+                                              project="test", package="repo-devel",
+                                              user=self.user, obs=self.obs)
+        LastSeenRevision.objects.create(mapping=self.mapping, revision="abc")
+        LastSeenRevision.objects.create(mapping=other, revision="def")
+        self.second.lookup(REPO)
+        overlap = datetime.timedelta(seconds=REVISION_OVERLAP)
+        self.second.revisions_loaded = datetime.datetime.now() - overlap
+        # rows that changed well before the previous load are not read again
+        LastSeenRevision.objects.filter(mapping=other).update(revision="old")
+        LastSeenRevision.objects.update(updated=self.second.revisions_loaded - overlap * 2)
+        record_revision([self.mapping], "123", {self.mapping.id: "abc"})
+        routes = dict((route.branch, route) for route in self.second.lookup(REPO, force=True))
+        self.assertEqual(routes["master"].revision, "123")
+        self.assertEqual(routes["devel"].revision, "def")
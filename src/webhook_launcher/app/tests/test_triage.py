@@ -0,0 +1,48 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from webhook_launcher.app import metrics
+from webhook_launcher.app.views import triage
+
+class TriageTest(TestCase):
+
+    def setUp(self):
+        self.registry = metrics.registry
+        metrics.registry = metrics.Registry()
+
+    def tearDown(self):
+        metrics.registry = self.registry
+
+    def events(self):
+        return sorted(dict(labels)["event"] for (name, labels) in metrics.registry.counters
+                      if name == "webhook_events_total")
+
+    def test_push(self):
+        request = RequestFactory().post("/", HTTP_X_GITHUB_EVENT="push")
+        self.assertEqual(triage(request), None)
+        self.assertEqual(self.events(), ["push"])
+
+    def test_other_events(self):
+        # one label value however many event names clients make up
+        for event in ("ping", "issues", "x" * 1000):
+            request = RequestFactory().post("/", HTTP_X_GITHUB_EVENT=event)
+            self.assertEqual(triage(request).status_code, 204)
+        self.assertEqual(self.events(), ["other"])
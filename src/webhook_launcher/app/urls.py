@@ -22,5 +22,10 @@ admin.autodiscover()
 
 urlpatterns = patterns('',
     (r'^admin/', include(admin.site.urls)), 
+    url(r'^metrics$', 'app.views.metrics_view', name='metrics'),
+    url(r'^api/mappings$', 'app.views.api_mappings', name='api_mappings'),
+    url(r'^profiles/$', 'app.views.profiles', name='profiles'),
+    url(r'^profiles/(?P<name>[\w.-]+)$', 'app.views.profile_file', name='profile_file'),
+    url(r'^batches/(?P<batch_id>\d+)/$', 'app.views.build_batch', name='build_batch'),
     url(r'$', 'app.views.index', name='index'),
 )
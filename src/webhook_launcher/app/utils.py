@@ -18,12 +18,36 @@
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from RuoteAMQP import Launcher
+from django.db import transaction, router
+from django.db.models.sql import DeleteQuery
 
 import pycurl
 import json
-
-from models import WebHookMapping, BuildService, LastSeenRevision
+import threading
+import datetime
+import traceback
+from collections import OrderedDict
+
+from webhook_launcher.app.models import WebHookMapping, BuildService, LastSeenRevision, PendingBuild, RouteVersion, BatchedBuild
+from webhook_launcher.app.launcher_pool import LauncherPool, RecordingLauncher
+from webhook_launcher.app.process_store import ProcessStore
+from webhook_launcher.app.http_client import HTTPClient, HTTPError
+from webhook_launcher.app.routes import route_table
+from webhook_launcher.app import eventlog
+from webhook_launcher.app import metrics
+
+launcher_pool = LauncherPool(max_size = settings.BOSS_MAX_CONNECTIONS,
+                             max_idle = settings.BOSS_CONNECTION_MAX_IDLE)
+if settings.BOSS_LAUNCHER_STUB:
+    print "BOSS launcher stub enabled, nothing will be launched"
+    launcher_pool.launcher_class = RecordingLauncher
+
+process_store = ProcessStore(settings.PROCESS_DIR)
+
+api_client = HTTPClient(connect_timeout = settings.API_CONNECT_TIMEOUT,
+                        timeout = settings.API_TIMEOUT,
+                        proxy = settings.OUTGOING_PROXY,
+                        proxy_port = settings.OUTGOING_PROXY_PORT)
 
 def launch(process, fields):
     """ BOSS process launcher
@@ -32,22 +56,133 @@ def launch(process, fields):
     :param fields: dict of workitem fields
     """
 
-    launcher = Launcher(amqp_host = settings.BOSS_HOST,
-                        amqp_user = settings.BOSS_USER,
-                        amqp_pass = settings.BOSS_PASS,
-                        amqp_vhost = settings.BOSS_VHOST)
+    launcher_pool.launch(settings.BOSS_HOST, settings.BOSS_USER,
+                         settings.BOSS_PASS, settings.BOSS_VHOST,
+                         process, fields)
+
+def _launch(kind, path, fields):
+    """ Launch the process definition at path, timed and counted as kind """
+
+    try:
+        with metrics.timer("launch_%s" % kind):
+            launch(process_store.get(path, fields), fields)
+    except Exception:
+        metrics.inc("webhook_launches_total", kind=kind, result="failed")
+        raise
+    metrics.inc("webhook_launches_total", kind=kind, result="ok")
+
+_coalesce = threading.local()
+
+class LaunchCollector(object):
+    """ Holds back notify and build launches while a burst of events is
+        processed, so that it results in one notify workitem per mapping
+        and one build per mapping for the newest revision
+    """
+
+    def __init__(self):
+        self.notifies = OrderedDict()
+        self.builds = OrderedDict()
+
+    @staticmethod
+    def _key(fields):
+        return (fields.get('repourl'), fields.get('branch'),
+                fields.get('project'), fields.get('package'))
+
+    def add_notify(self, fields):
+        self.notifies.setdefault(self._key(fields), []).append(fields)
+
+    def add_build(self, fields):
+        # later events carry newer revisions
+        self.builds[self._key(fields)] = fields
+
+    def flush(self):
+        notifies, self.notifies = self.notifies, OrderedDict()
+        builds, self.builds = self.builds, OrderedDict()
+
+        for fieldlist in notifies.values():
+            fields = dict(fieldlist[-1])
+            if len(fieldlist) > 1:
+                messages = []
+                for item in fieldlist:
+                    if item.get('msg') and item['msg'] not in messages:
+                        messages.append(item['msg'])
+                fields['msg'] = "; ".join(messages)
+                fields['events'] = len(fieldlist)
+            _launch("notify", settings.VCSCOMMIT_NOTIFY, fields)
+
+        for fields in builds.values():
+            _launch("build", settings.VCSCOMMIT_BUILD, fields)
+
+class coalesced_launches(object):
+    """ Context manager collecting launches made in this thread and
+        launching the merged result on exit
+    """
+
+    def __enter__(self):
+        self.collector = LaunchCollector()
+        _coalesce.collector = self.collector
+        return self.collector
 
-    launcher.launch(process, fields)
+    def __exit__(self, exc_type, exc_value, tb):
+        _coalesce.collector = None
+        if exc_type is None:
+            self.collector.flush()
+        return False
 
 def launch_notify(fields):
-    with open(settings.VCSCOMMIT_NOTIFY, mode='r') as process_file:
-        process = process_file.read()
-    launch(process, fields)
+    collector = getattr(_coalesce, "collector", None)
+    if collector is not None:
+        collector.add_notify(fields)
+        return
+    _launch("notify", settings.VCSCOMMIT_NOTIFY, fields)
 
 def launch_build(fields):
-    with open(settings.VCSCOMMIT_BUILD, mode='r') as process_file:
-        process = process_file.read()
-    launch(process, fields)
+    collector = getattr(_coalesce, "collector", None)
+    if collector is not None:
+        collector.add_build(fields)
+        return
+    _launch("build", settings.VCSCOMMIT_BUILD, fields)
+
+def schedule_build(mapobj, fields):
+    """ Queue a build of mapobj to be launched after the quiet period,
+        replacing a queued build of an older revision
+    """
+
+    due = datetime.datetime.now() + datetime.timedelta(seconds=settings.BUILD_QUIET_PERIOD)
+    pending, created = PendingBuild.objects.get_or_create(
+        mapping=mapobj, defaults={ 'revision' : fields['revision'],
+                                   'fields' : json.dumps(fields),
+                                   'due' : due })
+    if not created:
+        # a redelivery of the queued revision only restarts the quiet period
+        if pending.due is not None and pending.revision != fields['revision']:
+            eventlog.add("superseded", "%s:%s" % (mapobj.id, pending.revision))
+            pending.superseded += 1
+        pending.revision = fields['revision']
+        pending.fields = json.dumps(fields)
+        pending.due = due
+        pending.save()
+
+def launch_due_builds():
+    """ Launch queued builds whose quiet period is over, returns the count """
+
+    now = datetime.datetime.now()
+    launched = 0
+    for pending in PendingBuild.objects.filter(due__lte=now):
+        # claim it, unless another dispatcher or a newer revision got there first
+        if not PendingBuild.objects.filter(pk=pending.pk, due=pending.due).update(due=None):
+            continue
+        try:
+            launch_build(json.loads(pending.fields))
+        except Exception:
+            traceback.print_exc()
+            retry = now + datetime.timedelta(seconds=settings.BUILD_QUIET_PERIOD)
+            PendingBuild.objects.filter(pk=pending.pk, due__isnull=True).update(due=retry)
+            continue
+        PendingBuild.objects.filter(pk=pending.pk).update(
+            launched=pending.launched + 1, last_launched=now)
+        launched += 1
+    return launched
 
 def handle_commit(mapobj, user, payload):
     message = "%s commit(s) pushed by %s to %s branch of %s" % (len(payload["commits"]), user, mapobj.branch, mapobj.repourl)
@@ -57,7 +192,7 @@ def handle_commit(mapobj, user, payload):
     fields = mapobj.to_fields()
     fields['msg'] = message
     fields['payload'] = payload
-    print message
+    eventlog.add("launches", "notify:%s" % mapobj.id)
     launch_notify(fields)
 
 def rev_or_head(mapobj):
@@ -67,7 +202,11 @@ def rev_or_head(mapobj):
     else:
         return "HEAD"
 
-def handle_tag(mapobj, user, payload):
+def handle_tag(mapobj, user, payload, debounce=True, force=False, revision=None):
+    """ Notify about and build a tag of mapobj's branch. force makes
+        the build run even when its _service is unchanged. revision is
+        the tagged one, when the caller already knows it
+    """
 
     if mapobj.notify:
 
@@ -80,30 +219,127 @@ def handle_tag(mapobj, user, payload):
         fields = mapobj.to_fields()
         fields['msg'] = message
         fields['payload'] = payload
-        print message
+        eventlog.add("launches", "notify:%s" % mapobj.id)
         launch_notify(fields)
         
     if mapobj.build and mapobj.project and mapobj.package:
         fields = mapobj.to_fields()
         fields['branch'] = mapobj.branch
-        fields['revision'] = rev_or_head(mapobj)
+        fields['revision'] = revision or rev_or_head(mapobj)
         fields['payload'] = payload
-        print "build"
-        launch_build(fields)
+        if force:
+            fields['force'] = True
+        if debounce and settings.BUILD_QUIET_PERIOD:
+            eventlog.add("launches", "queued-build:%s" % mapobj.id)
+            schedule_build(mapobj, fields)
+        else:
+            eventlog.add("launches", "build:%s" % mapobj.id)
+            launch_build(fields)
+
+def last_seen_revisions(mapobjs):
+    """ mapping id -> last seen revision for mapobjs, in one query """
+
+    return dict(LastSeenRevision.objects.filter(
+        mapping__in=[mapobj.id for mapobj in mapobjs]).values_list('mapping_id', 'revision'))
+
+def record_revision(mapobjs, revision, seen):
+    """ Make revision the last seen one of all mapobjs
+
+    Changed rows are written with one update and missing ones with one
+    bulk insert, in a single transaction.
+
+    :param seen: result of last_seen_revisions(mapobjs)
+    """
+
+    changed = [mapobj.id for mapobj in mapobjs
+               if mapobj.id in seen and seen[mapobj.id] != revision]
+    missing = [mapobj.id for mapobj in mapobjs if mapobj.id not in seen]
+    if not changed and not missing:
+        return
+
+    with transaction.commit_on_success():
+        if changed:
+            # update() skips auto_now
+            LastSeenRevision.objects.filter(mapping__in=changed).update(
+                revision=revision, updated=datetime.datetime.now())
+        if missing:
+            LastSeenRevision.objects.bulk_create(
+                [LastSeenRevision(mapping_id=mapping_id, revision=revision)
+                 for mapping_id in missing])
+    # bulk operations send no signals
+    route_table.seen(changed + missing, revision)
+
+# ids per IN clause, below the sqlite limit of host parameters
+DELETE_CHUNK = 500
+
+def _delete_rows(model, pks):
+    """ Delete rows by primary key, without collecting related objects
+        or sending signals
+    """
+
+    using = router.db_for_write(model)
+    for start in range(0, len(pks), DELETE_CHUNK):
+        DeleteQuery(model).delete_batch(pks[start:start + DELETE_CHUNK], using)
+    return len(pks)
+
+def delete_mappings(mapping_ids):
+    """ Delete mappings with their last seen revisions, pending and
+        batched builds, set based and in a single transaction
+
+    :returns: dict of the number of rows deleted per kind
+    """
+
+    mapping_ids = sorted(set(mapping_ids))
+    summary = { "mappings" : 0, "revisions" : 0, "pending_builds" : 0,
+                "batched_builds" : 0 }
+    if not mapping_ids:
+        return summary
+
+    with transaction.commit_on_success():
+        revisions = []
+        pending = []
+        batched = []
+        for start in range(0, len(mapping_ids), DELETE_CHUNK):
+            chunk = mapping_ids[start:start + DELETE_CHUNK]
+            revisions.extend(LastSeenRevision.objects.filter(
+                mapping__in=chunk).values_list('id', flat=True))
+            pending.extend(PendingBuild.objects.filter(
+                mapping__in=chunk).values_list('id', flat=True))
+            batched.extend(BatchedBuild.objects.filter(
+                mapping__in=chunk).values_list('id', flat=True))
+        summary["revisions"] = _delete_rows(LastSeenRevision, revisions)
+        summary["pending_builds"] = _delete_rows(PendingBuild, pending)
+        summary["batched_builds"] = _delete_rows(BatchedBuild, batched)
+        summary["mappings"] = _delete_rows(WebHookMapping, mapping_ids)
+
+    # bulk deletes send no signals
+    route_table.invalidate()
+    RouteVersion.bump(RouteVersion.LISTING)
+    return summary
 
 def create_placeholder(repourl, branch):
 
+    # unmapped refs are ignored without a query
     if not settings.DEFAULT_PROJECT:
         return []
 
-    print "no mapping, create placeholder"
-    mapobj = WebHookMapping()
-    mapobj.repourl = repourl
-    mapobj.branch = branch
-    mapobj.user = User.objects.get(id=1)
-    mapobj.obs = BuildService.objects.all()[0]
-    mapobj.notify = False
-    mapobj.save()
+    # the route table of this process may not know yet about a mapping
+    # another process just created
+    existing = list(WebHookMapping.objects.select_related('obs').filter(
+        repourl=repourl, branch=branch))
+    if existing:
+        return existing
+
+    eventlog.add("placeholders", branch)
+    metrics.inc("webhook_placeholders_total")
+    with metrics.timer("placeholder"):
+        mapobj = WebHookMapping()
+        mapobj.repourl = repourl
+        mapobj.branch = branch
+        mapobj.user = User.objects.get(id=1)
+        mapobj.obs = BuildService.objects.all()[0]
+        mapobj.notify = False
+        mapobj.save()
     return WebHookMapping.objects.filter(repourl=repourl, branch=branch)
 
 def github_webhook_launch(repourl, payload):
@@ -121,31 +357,25 @@ def github_webhook_launch(repourl, payload):
             # nor the commit sha1 it points at. The tag itself is enough to tell what to pull and build
             # but we wouldn't know which project / package to trigger
             # try to use the head sha1sum to detect
-            print "annotated tag on %s" % repourl
+            eventlog.note(annotated=True)
             branches = []
 
     elif reftype == "heads":
     # commit to branch
         branches = [refname]
 
-    print repourl
-    print branches
-    mapobj = None
-    mapobjs = WebHookMapping.objects.filter(repourl=repourl)
-    if branches:
-        mapobjs = mapobjs.filter(branch__in=branches)
-    print mapobjs
+    eventlog.note(repo=repourl, ref=payload['ref'], branches=branches)
+    with metrics.timer("lookup"):
+        routes = route_table.lookup(repourl, branches)
 
     zerosha = '0000000000000000000000000000000000000000'
     # action
     if payload.get('after', '') == zerosha:
         #deleted
-        if reftype == "heads":
-            for mapobj in mapobjs:
-                # branch was deleted
-                # FIXME: Notify
-                # NOTE: do related objects get removed ?
-                mapobj.delete()
+        if reftype == "heads" and routes:
+            # branch was deleted
+            # FIXME: Notify
+            eventlog.note(deleted=delete_mappings([route.id for route in routes]))
     else:
         #created or changed
         #the head commit is either the branch's HEAD or what the tag is pointing at
@@ -161,18 +391,31 @@ def github_webhook_launch(repourl, payload):
         if not revision or not name:
             return
 
-        if not len(mapobjs):
+        if not routes:
             mapobjs = []
             for branch in branches:
                 mapobjs.extend(list(create_placeholder(repourl, branch)))
+        else:
+            # only load the mappings this event changes or launches something for
+            active = [route.id for route in routes
+                      if route.needs_action(revision, tag=(reftype == "tags"),
+                                            branches=bool(branches))]
+            if not active:
+                eventlog.note(revision=revision, decision="seen")
+                return
+            mapobjs = WebHookMapping.objects.select_related('obs').filter(pk__in=active)
+        mapobjs = list(mapobjs)
+        eventlog.note(revision=revision, mappings=[mapobj.id for mapobj in mapobjs])
+
+        with metrics.timer("bookkeeping"):
+            seen = last_seen_revisions(mapobjs)
+            if branches:
+                record_revision(mapobjs, revision, seen)
 
         for mapobj in mapobjs:
-            seenrev, created = LastSeenRevision.objects.get_or_create(mapping=mapobj)
-            if created or seenrev.revision != revision:
+            if seen.get(mapobj.id) != revision:
                 if branches:
-                    print "%s in %s was not seen before, notify it if enabled" % (revision, mapobj.branch)
-                    seenrev.revision = revision
-                    seenrev.save()
+                    eventlog.add("unseen", mapobj.id)
                 else:
                     # annotated tag. only continue if we already had a mapping with a matching
                     # revision
@@ -186,87 +429,91 @@ def github_webhook_launch(repourl, payload):
                     notified = True
 
             elif reftype == "tags":
-                print "Tag %s for %s in %s/%s, notify and build it if enabled" % (refname, revision, repourl, mapobj.branch)
-                handle_tag(mapobj, name, payload)
+                # the branch was just recorded at, or already seen at, revision
+                handle_tag(mapobj, name, payload, revision=revision)
 
 class bbAPIcall(object):
     def __init__(self, slug):
-        self.contents = ''
         self.base = "https://api.bitbucket.org/1.0"
         self.slug = slug
 
-    def body_callback(self, buf):
-        self.contents += buf
-
-    def api_call(self, endpoint, call):
-        c = pycurl.Curl()
-        c.setopt(pycurl.SSL_VERIFYPEER, 0)
-        c.setopt(pycurl.SSL_VERIFYHOST, 0)
-        if settings.OUTGOING_PROXY:
-            c.setopt(pycurl.PROXY, settings.OUTGOING_PROXY)
-            c.setopt(pycurl.PROXYPORT, settings.OUTGOING_PROXY_PORT)
-        c.setopt(pycurl.NETRC, 1)
+    def api_call(self, endpoint, call, ttl=None):
         url = str("/%s/%s/%s" % (endpoint, self.slug, call)).replace("//","/")
         url = self.base + url
-        c.setopt(pycurl.URL, url)
-        c.setopt(c.WRITEFUNCTION, self.body_callback)
-        c.perform()
-        c.close()
+        try:
+            with metrics.timer("api_call"):
+                data = api_client.get_json(url, ttl)
+        except (pycurl.error, HTTPError, ValueError):
+            metrics.inc("webhook_api_calls_total", result="failed")
+            raise
+        metrics.inc("webhook_api_calls_total", result="ok")
+        return data
 
     def branches_tags(self):
-        self.api_call('repositories', 'branches-tags')
-        return json.loads(self.contents)
+        # always revalidated, a tag pushed just now must be listed
+        return self.api_call('repositories', 'branches-tags', ttl=0)
+
+def tagged_tips(branches_tags):
+    """ branch -> head of the branches whose head is tagged, from a
+        branches-tags API response
+    """
+
+    tagged = set(tag['changeset'] for tag in branches_tags['tags'])
+    return dict((branch['name'], branch['changeset'])
+                for branch in branches_tags['branches']
+                if branch['changeset'] in tagged)
 
 def bitbucket_webhook_launch(repourl, payload):
-    mapobj = None
     tips = {}
 
-    #generate pairs of branch : commits in this commit
+    # head of each branch pushed to, commits are listed oldest first
     for comm in payload['commits']:
         if not comm['branch']:
-            print "Dangling commit !" 
+            eventlog.add("dangling", comm['raw_node'])
         else:
-            if not comm['branch'] in tips:
-                tips[comm['branch']] = []
-            tips[comm['branch']].append(comm['raw_node'])
+            tips[comm['branch']] = comm['raw_node']
 
-    if not len(tips.keys()):
-        print "no tips due to empty event, calling api"
+    if not tips:
+        # tags only push
+        eventlog.note(branches_tags_api=True)
         bbcall = bbAPIcall(payload['repository']['absolute_url'])
-        bts = bbcall.branches_tags()
-        for branch in bts['branches']:
-            print branch
-            for tag in bts['tags']:
-                print tag
-                if tag['changeset'] == branch['changeset']:
-                    print "found tagged branch"
-                    tips[branch['name']] = [branch['changeset']] 
+        tips = tagged_tips(bbcall.branches_tags())
 
-    print tips
+    eventlog.note(repo=repourl, tips=tips)
 
-    for branch, commits in tips.items():
+    for branch, head in tips.items():
 
-        mapobjs = WebHookMapping.objects.filter(repourl=repourl, branch=branch)
+        with metrics.timer("lookup"):
+            routes = route_table.lookup(repourl, [branch])
 
-        if not len(mapobjs):
+        if not routes:
             mapobjs = create_placeholder(repourl, branch)
+        else:
+            active = [route.id for route in routes
+                      if route.needs_action(head, tag=True)]
+            if not active:
+                eventlog.add("seen", branch)
+                continue
+            mapobjs = WebHookMapping.objects.select_related('obs').filter(pk__in=active)
+
+        mapobjs = list(mapobjs)
+        with metrics.timer("bookkeeping"):
+            seen = last_seen_revisions(mapobjs)
+            record_revision(mapobjs, head, seen)
 
         notified = False
         for mapobj in mapobjs:
-            print "found or created mapping"
-
-            seenrev, created = LastSeenRevision.objects.get_or_create(mapping=mapobj)
+            if seen.get(mapobj.id) != head:
 
-            if created or seenrev.revision != commits[-1]:
-
-                print "%s in %s was not seen before, notify it if enabled" % (commits[-1], branch)
-                seenrev.revision = commits[-1]
-                seenrev.save()
+                eventlog.add("unseen", mapobj.id)
 
                 if mapobj.notify and not notified:
                     handle_commit(mapobj, payload["user"], payload)
                     notified = True
 
             else:
-                print "%s in %s was seen before, notify and build it if enabled" % (commits[-1], branch)
-                handle_tag(mapobj, payload["user"], payload)
+                handle_tag(mapobj, payload["user"], payload, revision=head)
+
+# provider name -> launch function, used to replay spooled events
+WEBHOOK_LAUNCHERS = { "github" : github_webhook_launch,
+                      "bitbucket" : bitbucket_webhook_launch }
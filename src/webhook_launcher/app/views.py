@@ -18,114 +18,349 @@
 
 """ webhook view """
 
+import datetime
+import time
 import urlparse
 from collections import defaultdict
 from django.http import ( HttpResponse, HttpResponseBadRequest,
-                          HttpResponseForbidden, HttpResponseNotAllowed )
+                          HttpResponseForbidden, HttpResponseNotAllowed,
+                          HttpResponseNotModified, Http404 )
+from django.template.loader import render_to_string
 from django.shortcuts import render_to_response
 from django.template import RequestContext
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
 from django.utils import simplejson
 from django.conf import settings
-from utils import bitbucket_webhook_launch, github_webhook_launch
-from models import WebHookMapping
-from pprint import pprint
-import struct, socket
+from webhook_launcher.app.utils import WEBHOOK_LAUNCHERS
+from webhook_launcher.app.models import WebHookMapping, RouteVersion, BuildBatch, BatchedBuild
+from webhook_launcher.app.dispatcher import spool_event
+from webhook_launcher.app.dedup import deliveries, delivery_key
+from webhook_launcher.app import eventlog
+from webhook_launcher.app import metrics
+from webhook_launcher.app.profiling import profiles as profile_store, profile_call, repo_label
+
+API_MAX_PER_PAGE = 1000
+
+# (header, event types worth decoding the payload for)
+EVENT_HEADERS = (
+    ("HTTP_X_GITHUB_EVENT", "github", ("push",)),
+    ("HTTP_X_GITLAB_EVENT", "gitlab", ("Push Hook", "Tag Push Hook")),
+    ("HTTP_X_EVENT_KEY", "bitbucket", ("repo:push",)),
+)
+
+def triage(request):
+    """ Decide from the headers alone whether a POST is worth decoding
+
+    Returns None to go on, or the response for events that are not
+    pushes and for oversized bodies.
+    """
+
+    provider, event = "unknown", "unknown"
+    accepted = True
+    for header, name, wanted in EVENT_HEADERS:
+        if header in request.META:
+            provider, event = name, request.META[header]
+            accepted = event in wanted
+            if not accepted:
+                # the header is chosen by the client, keep the metric
+                # labels and the event log to known values
+                event = "other"
+            break
+
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+
+    eventlog.note(provider=provider, event=event)
+    if settings.MAX_PAYLOAD_BYTES and length > settings.MAX_PAYLOAD_BYTES:
+        metrics.inc("webhook_events_total", provider=provider, event=event, result="too_large")
+        eventlog.note(decision="rejected", reason="payload of %s bytes" % length)
+        return HttpResponse(status=413)
+    if not accepted:
+        metrics.inc("webhook_events_total", provider=provider, event=event, result="ignored")
+        eventlog.note(decision="ignored", reason="event type")
+        return HttpResponse(status=204)
+
+    metrics.inc("webhook_events_total", provider=provider, event=event, result="accepted")
+    return None
+
+def metrics_view(request):
+    """ Counters and histograms in prometheus text format, for the
+        allowed addresses
+    """
+
+    if request.META.get("REMOTE_ADDR", "") not in settings.METRICS_ALLOW:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(),
+                        content_type="text/plain; version=0.0.4")
+
+@staff_member_required
+def profiles(request):
+    """ List of stored webhook profiles """
+
+    listing = [{ "name" : name,
+                 "taken" : datetime.datetime.fromtimestamp(mtime),
+                 "size" : size } for name, mtime, size in profile_store.list()]
+    return render_to_response('app/profiles.html',
+                              { 'profiles' : listing,
+                                'path' : profile_store.path,
+                                'keep' : profile_store.keep },
+                              context_instance=RequestContext(request))
+
+@staff_member_required
+def profile_file(request, name):
+    """ Download a stored profile report or stats file """
+
+    path = profile_store.file(name)
+    if path is None:
+        raise Http404
+    with open(path, "rb") as pfile:
+        content = pfile.read()
+    if name.endswith(".txt"):
+        return HttpResponse(content, content_type="text/plain")
+    response = HttpResponse(content, content_type="application/octet-stream")
+    response["Content-Disposition"] = 'attachment; filename="%s"' % name
+    return response
+
+@staff_member_required
+def build_batch(request, batch_id):
+    """ Progress of builds triggered together from the admin """
+
+    try:
+        batch = BuildBatch.objects.select_related('user').get(pk=batch_id)
+    except BuildBatch.DoesNotExist:
+        raise Http404
+    counts = batch.counts()
+    failed = batch.batchedbuild_set.filter(state=BatchedBuild.FAILED).select_related('mapping')
+    return render_to_response('app/build_batch.html',
+                              { 'batch' : batch,
+                                'launched' : counts[BatchedBuild.LAUNCHED],
+                                'failed' : counts[BatchedBuild.FAILED],
+                                'pending' : counts[BatchedBuild.NEW] + counts[BatchedBuild.RUNNING],
+                                'failures' : failed[:100] },
+                              context_instance=RequestContext(request))
 
 def index(request):
     """
     GET: returns 403
 
-    POST: process a webhook callback from bitbucket or github
+    POST: process a webhook callback from bitbucket or github. When
+    asynchronous dispatch is enabled the payload is only spooled and
+    202 is returned; webhook_dispatcher launches it later.
     """
 
     if request.method == 'GET':
-        print "GET from %s" % request.META.get("REMOTE_HOST", None)
         if not settings.PUBLIC_LANDING_PAGE and not request.user.is_authenticated():
             return HttpResponseForbidden()
+        return landing_page(request)
+
+    if request.method == 'POST':
+        eventlog.begin(remote=request.META.get("REMOTE_ADDR", None))
+        started = time.time()
+        response = None
+        try:
+            response = webhook_post(request)
+            return response
+        except Exception:
+            metrics.inc("webhook_failures_total")
+            eventlog.note(decision="error")
+            raise
+        finally:
+            status = 500
+            if response is not None:
+                status = response.status_code
+            metrics.observe("webhook_request_seconds", time.time() - started, status=status)
+            eventlog.finish(status=status)
+
+    return HttpResponseNotAllowed(['GET', 'POST'])
+
+def landing_page(request):
+    """ List of complete mappings, cached until a mapping changes """
+
+    version = RouteVersion.current(RouteVersion.LISTING)
+    etag = '"mappings-%s"' % version
+    if request.META.get("HTTP_IF_NONE_MATCH") == etag:
+        return HttpResponseNotModified()
 
+    cache_key = "landing-page-%s" % version
+    content = cache.get(cache_key)
+    if content is None:
         mappings = defaultdict(list)
-        maps = WebHookMapping.objects.all().exclude(package="")
-        for mapobj in maps:
-            repourl = urlparse.urlparse(mapobj.repourl)
+        maps = WebHookMapping.objects.exclude(package="").values_list(
+            'repourl', 'branch', 'project', 'package')
+        for repourl, branch, project, package in maps:
+            repourl = urlparse.urlparse(repourl)
             mappings[repourl.netloc].append({ "path" : repourl.path,
-                                         "branch" : mapobj.branch,
-                                         "project" : mapobj.project,
-                                         "package" : mapobj.package})
-        return render_to_response('app/index.html', {'mappings' : dict(mappings)},
-                                  context_instance=RequestContext(request))
+                                         "branch" : branch,
+                                         "project" : project,
+                                         "package" : package})
+        content = render_to_string('app/index.html', {'mappings' : dict(mappings)})
+        cache.set(cache_key, content, settings.LANDING_CACHE_TTL)
 
-    if request.method == 'POST':
-        # Use the ip_filter to decide whether to accept a post
-        if settings.POST_IP_FILTER:
+    response = HttpResponse(content)
+    response["ETag"] = etag
+    return response
+
+def api_mappings(request):
+    """
+    GET: page of complete mappings as JSON, streamed
+
+    Filters: host, project, package. Paging: page (from 1) and per_page.
+    """
+
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not settings.PUBLIC_LANDING_PAGE and not request.user.is_authenticated():
+        return HttpResponseForbidden()
+
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+        per_page = min(max(int(request.GET.get("per_page", 100)), 1), API_MAX_PER_PAGE)
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    maps = WebHookMapping.objects.exclude(package="").order_by('id')
+    if request.GET.get("host"):
+        maps = maps.filter(repourl__icontains="://%s/" % request.GET["host"])
+    if request.GET.get("project"):
+        maps = maps.filter(project=request.GET["project"])
+    if request.GET.get("package"):
+        maps = maps.filter(package=request.GET["package"])
+    count = maps.count()
+    rows = maps.values_list('id', 'repourl', 'branch', 'project', 'package')
+    rows = rows[(page - 1) * per_page:page * per_page]
+
+    def stream():
+        yield '{"count": %d, "page": %d, "per_page": %d, "next": %s, "mappings": [' % (
+            count, page, per_page,
+            simplejson.dumps(page * per_page < count and page + 1 or None))
+        sep = ""
+        for pk, repourl, branch, project, package in rows.iterator():
+            yield sep + simplejson.dumps({ "id" : pk,
+                                           "repourl" : repourl,
+                                           "host" : urlparse.urlparse(repourl).netloc,
+                                           "branch" : branch,
+                                           "project" : project,
+                                           "package" : package })
+            sep = ", "
+        yield "]}"
+
+    return HttpResponse(stream(), content_type="application/json")
+
+def webhook_post(request):
+    """ Validate and launch (or spool) one webhook POST """
+
+    # Use the ip_filter to decide whether to accept a post
+    if settings.POST_IP_FILTER:
+        with metrics.timer("ip_filter"):
             # If behind a rev-proxy then use XFF header
             if settings.POST_IP_FILTER_HAS_REV_PROXY:
                 # Take the last value only to avoid spoofing
-                ip = request.META["HTTP_X_FORWARDED_FOR"].split(",")[-1]
-                print "Using %s as IP from HTTP_X_FORWARDED_FOR: %s" % ( ip, request.META["HTTP_X_FORWARDED_FOR"] )
+                ip = request.META["HTTP_X_FORWARDED_FOR"].split(",")[-1].strip()
             else:
-                ip = request.META["REMOTE_IP"]
-            ipaddr = struct.unpack('<L', socket.inet_aton(ip))[0]
-            ip_ok = False
-            for netmask in settings.NETMASKS:
-                if ipaddr & netmask == netmask:
-                    ip_ok = True
-                    break
-            if not ip_ok:
-                print "POST from %s not in settings.post_ip_filter" % ( ip )
-                return HttpResponseBadRequest()
-
-        ctype = request.META.get("CONTENT_TYPE", None)
-        if ctype == "application/json":
-            payload = request.raw_post_data
-        elif ctype == "application/x-www-form-urlencoded":
-            payload = request.POST.get("payload", None)
-        else:
-            print "POST with unknown content type %s from %s" % ( ctype , request.META.get("REMOTE_HOST", None))
-            print request
+                ip = request.META["REMOTE_ADDR"]
+            allowed = ip in settings.POST_IP_MATCHER
+        eventlog.note(ip=ip)
+        if not allowed:
+            eventlog.note(decision="rejected", reason="ip not in post_ip_filter")
             return HttpResponseBadRequest()
 
-        try:
+    response = triage(request)
+    if response is not None:
+        return response
+
+    ctype = request.META.get("CONTENT_TYPE", None)
+    if ctype == "application/json":
+        payload = request.raw_post_data
+    elif ctype == "application/x-www-form-urlencoded":
+        payload = request.POST.get("payload", None)
+    else:
+        eventlog.note(decision="rejected", reason="unknown content type %s" % ctype)
+        return HttpResponseBadRequest()
+
+    if payload and settings.MAX_PAYLOAD_BYTES and len(payload) > settings.MAX_PAYLOAD_BYTES:
+        # sent without a Content-Length
+        eventlog.note(decision="rejected", reason="payload of %s bytes" % len(payload))
+        return HttpResponse(status=413)
+
+    key = None
+    if settings.DEDUP_SIZE:
+        key = delivery_key(request)
+        if key and not deliveries.claim(key):
+            metrics.inc("webhook_duplicates_total")
+            eventlog.note(decision="duplicate", delivery=key)
+            return HttpResponse("duplicate delivery")
+    if not key:
+        return handle_payload(payload)
+
+    try:
+        response = handle_payload(payload)
+    except Exception:
+        deliveries.release(key)
+        raise
+    if response.status_code >= 400:
+        deliveries.release(key)
+    return response
+
+def handle_payload(payload):
+    """ Decode a webhook payload and launch (or spool) it """
+
+    try:
+        with metrics.timer("decode"):
             data = simplejson.loads(payload)
-        except Exception as e:
-            print "POST with invalid JSON payload from %s" % request.META.get("REMOTE_HOST", None)
-            return HttpResponseBadRequest()
+    except Exception:
+        eventlog.note(decision="rejected", reason="invalid JSON payload")
+        return HttpResponseBadRequest()
+    eventlog.payload(data)
 
-        pprint(data, indent=2, width=80, depth=6)
-
-        url = None
-        func = None
-        repo = data.get('repository', None)
-        if repo:
-            if repo.get('absolute_url', None):
-                # bitbucket type payload
-                url = repo.get('absolute_url', None)
-                canon_url = data.get('canon_url', None)
-                if canon_url and url:
-                    print "bitbucket payload from %s" % request.META.get("REMOTE_HOST", None)
-                    if url.endswith('/'):
-                        url = url[:-1]
-                    url = urlparse.urljoin(canon_url, url)
-                    if not url.endswith(".git"):
-                        url = url + ".git"
-                    func = bitbucket_webhook_launch
-            elif repo.get('url', None):
-                # github type payload
-                url = repo.get('url', None)
-                if url:
-                    print "github payload from %s" % request.META.get("REMOTE_HOST", None)
-                    if not url.endswith(".git"):
-                        url = url + ".git"
-                    func = github_webhook_launch
-
-        if not url or not func:
-            print "unknown payload from %s" % request.META.get("REMOTE_HOST", None)
-            return HttpResponseBadRequest()
+    url = None
+    provider = None
+    repo = data.get('repository', None)
+    if repo:
+        if repo.get('absolute_url', None):
+            # bitbucket type payload
+            url = repo.get('absolute_url', None)
+            canon_url = data.get('canon_url', None)
+            if canon_url and url:
+                if url.endswith('/'):
+                    url = url[:-1]
+                url = urlparse.urljoin(canon_url, url)
+                if not url.endswith(".git"):
+                    url = url + ".git"
+                provider = "bitbucket"
+        elif repo.get('url', None):
+            # github type payload
+            url = repo.get('url', None)
+            if url:
+                if not url.endswith(".git"):
+                    url = url + ".git"
+                provider = "github"
 
-        if ((not settings.SERVICE_WHITELIST) or
-            (settings.SERVICE_WHITELIST and
-             urlparse.urlparse(url).netloc in settings.SERVICE_WHITELIST)):
-            func(url, data)
+    if not url or not provider:
+        eventlog.note(decision="rejected", reason="unknown payload")
+        return HttpResponseBadRequest()
+    eventlog.note(provider=provider, repo=url)
 
-        return HttpResponse()
+    if ((not settings.SERVICE_WHITELIST) or
+        (settings.SERVICE_WHITELIST and
+         urlparse.urlparse(url).netloc in settings.SERVICE_WHITELIST)):
+        label = repo_label(url)
+        if label:
+            return profile_call(label, launch_payload, provider, url, payload, data)
+        return launch_payload(provider, url, payload, data)
 
-    return HttpResponseNotAllowed(['GET', 'POST'])
+    eventlog.note(decision="ignored", reason="service not whitelisted")
+    return HttpResponse()
+
+def launch_payload(provider, url, payload, data):
+    """ Launch (or spool) a decoded payload of an accepted repository """
+
+    if settings.ASYNC_DISPATCH:
+        spool_event(provider, url, payload, data)
+        eventlog.note(decision="spooled")
+        return HttpResponse(status=202)
+    WEBHOOK_LAUNCHERS[provider](url, data)
+    eventlog.decide("handled")
+    return HttpResponse()
@@ -0,0 +1,165 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" compiled IPv4 / IPv6 network matcher used by the POST ip filter """
+
+import bisect
+import json
+import os
+import socket
+import threading
+import time
+
+_V4_MAPPED = "::ffff:"
+
+def parse_address(ip):
+    """ (family, integer value, bit length) of an IPv4 or IPv6 address """
+
+    ip = ip.strip()
+    if ip.lower().startswith(_V4_MAPPED) and "." in ip:
+        ip = ip[len(_V4_MAPPED):]
+    if ":" in ip:
+        packed = socket.inet_pton(socket.AF_INET6, ip)
+        family, bits = socket.AF_INET6, 128
+    else:
+        packed = socket.inet_pton(socket.AF_INET, ip)
+        family, bits = socket.AF_INET, 32
+    return family, int(packed.encode("hex"), 16), bits
+
+def parse_network(cidr):
+    """ (family, first, last) address values of a network in CIDR notation.
+        A plain address is a network of one.
+    """
+
+    cidr = cidr.strip()
+    if "/" in cidr:
+        ip, prefix = cidr.split("/", 1)
+        prefix = int(prefix)
+    else:
+        ip, prefix = cidr, None
+    family, value, bits = parse_address(ip)
+    if prefix is None:
+        prefix = bits
+    if prefix < 0 or prefix > bits:
+        raise ValueError("bad prefix length in %s" % cidr)
+    hostmask = (1 << (bits - prefix)) - 1
+    first = value & ~hostmask
+    return family, first, first | hostmask
+
+def read_networks(path):
+    """ Networks listed in a file
+
+    The file is either a list of CIDRs separated by commas or newlines,
+    with # comments, or JSON like github's meta API response, in which
+    case the "hooks" list is used.
+    """
+
+    with open(path) as netfile:
+        content = netfile.read()
+    if content.lstrip().startswith("{"):
+        return json.loads(content).get("hooks", [])
+    networks = []
+    for line in content.splitlines():
+        line = line.split("#", 1)[0]
+        networks.extend(net.strip() for net in line.split(",") if net.strip())
+    return networks
+
+class NetworkMatcher(object):
+    """ Tells whether an address is in one of a set of networks
+
+    Networks are compiled into sorted, merged intervals per address
+    family, so a lookup is a binary search. When path is given the
+    networks listed in it are added, and the file is read again when it
+    changes, checked at most every check_interval seconds.
+
+    Networks that can't be read or parsed raise ValueError on creation.
+    On a reload they are reported and the previous networks stay in use.
+    """
+
+    def __init__(self, networks=(), path=None, check_interval=60):
+        self.networks = list(networks)
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.checked = 0
+        self.table = {}
+        try:
+            self._compile(self.networks + self._file_networks())
+        except (IOError, OSError, ValueError, socket.error), exc:
+            raise ValueError("invalid POST ip filter networks: %s" % exc)
+
+    def _file_networks(self):
+        if not self.path:
+            return []
+        self.mtime = os.stat(self.path).st_mtime
+        try:
+            return read_networks(self.path)
+        except ValueError, exc:
+            raise ValueError("%s: %s" % (self.path, exc))
+
+    def _compile(self, networks):
+        intervals = {}
+        for cidr in networks:
+            family, first, last = parse_network(cidr)
+            intervals.setdefault(family, []).append((first, last))
+
+        table = {}
+        for family, ranges in intervals.items():
+            ranges.sort()
+            merged = [list(ranges[0])]
+            for first, last in ranges[1:]:
+                if first <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], last)
+                else:
+                    merged.append([first, last])
+            table[family] = ([first for first, last in merged],
+                             [last for first, last in merged])
+        self.table = table
+
+    def _maybe_reload(self):
+        now = time.time()
+        if not self.path or now - self.checked < self.check_interval:
+            return
+        with self.lock:
+            if now - self.checked < self.check_interval:
+                return
+            self.checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                return
+            if mtime != self.mtime:
+                # _compile only replaces the table once all networks parsed
+                try:
+                    self._compile(self.networks + self._file_networks())
+                    print "Reloaded POST ip filter from %s" % self.path
+                except (IOError, OSError, ValueError, socket.error), exc:
+                    print "Keeping old POST ip filter, %s is invalid: %s" % (self.path, exc)
+
+    def __contains__(self, ip):
+        self._maybe_reload()
+        try:
+            family, value, bits = parse_address(ip)
+        except (socket.error, ValueError):
+            return False
+        if family not in self.table:
+            return False
+        starts, ends = self.table[family]
+        pos = bisect.bisect_right(starts, value) - 1
+        return pos >= 0 and value <= ends[pos]
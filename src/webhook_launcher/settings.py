@@ -17,7 +17,8 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 from os.path import abspath, dirname, join
-import struct,socket
+from django.core.exceptions import ImproperlyConfigured
+from webhook_launcher.ipfilter import NetworkMatcher
 PROJECT_DIR = dirname(__file__)
 
 WEBHOOKCONF="/etc/skynet/webhook.conf"
@@ -43,6 +44,12 @@ if config.has_option('web', 'default_project'):
 
 USE_REMOTE_AUTH = config.getboolean('web', 'use_http_remote_user')
 
+# seconds the rendered landing page is cached, it is also dropped as
+# soon as a mapping changes
+LANDING_CACHE_TTL = 300
+if config.has_option('web', 'landing_cache_ttl'):
+    LANDING_CACHE_TTL = config.getint('web', 'landing_cache_ttl')
+
 PUBLIC_LANDING_PAGE = False
 if config.has_option('web', 'default_project'):
     PUBLIC_LANDING_PAGE = config.getboolean('web', 'public_landing_page')
@@ -54,33 +61,152 @@ if config.has_option('web', 'service_whitelist'):
 # IP filtering for POST
 POST_IP_FILTER = False
 POST_IP_FILTER_HAS_REV_PROXY = False
-NETMASKS=[]
-if config.has_option('web', 'post_ip_filter'):
+POST_IP_MATCHER = None
+if config.has_option('web', 'post_ip_filter') or config.has_option('web', 'post_ip_filter_file'):
     POST_IP_FILTER = True
     if config.has_option('web', 'post_ip_filter_has_rev_proxy'):
         POST_IP_FILTER_HAS_REV_PROXY = True
-    # http://stackoverflow.com/questions/819355/how-can-i-check-if-an-ip-is-in-a-network-in-python
-    # settings.post_ip_filter should be a list of IPs or CIDR (eg
-    # 10.0.0.0/24)
-    for ip in config.get('web', 'post_ip_filter').split(","):
-        ip = ip.strip()
-        if "/" in ip :
-            ip,bits = ip.split('/')
-            bits=int(bits)
-        else:
-            bits=32
-        print "Allow POST from %s / %d" % (ip, bits)
-        NETMASKS.append(struct.unpack('<L',socket.inet_aton(ip))[0] & ((2L<<bits-1) - 1))
+    # settings.post_ip_filter should be a list of IPv4 / IPv6 addresses or
+    # CIDR (eg 10.0.0.0/24, 2620:112:3000::/44)
+    networks = []
+    if config.has_option('web', 'post_ip_filter'):
+        networks = [ ip.strip() for ip in config.get('web', 'post_ip_filter').split(",") if ip.strip() ]
+    for ip in networks:
+        print "Allow POST from %s" % ip
+    post_ip_filter_file = None
+    if config.has_option('web', 'post_ip_filter_file'):
+        post_ip_filter_file = config.get('web', 'post_ip_filter_file')
+        print "Allow POST from networks in %s" % post_ip_filter_file
+    try:
+        POST_IP_MATCHER = NetworkMatcher(networks, path=post_ip_filter_file)
+    except ValueError, exc:
+        raise ImproperlyConfigured(str(exc))
+
+# POSTs with larger bodies are refused before decoding, 0 for no limit
+MAX_PAYLOAD_BYTES = 5 * 1024 * 1024
+if config.has_option('web', 'max_payload_bytes'):
+    MAX_PAYLOAD_BYTES = config.getint('web', 'max_payload_bytes')
+
+# deliveries whose id was seen within the last dedup_ttl seconds are
+# acknowledged without handling them again. dedup_size bounds the in process cache, 0
+# turns deduplication off. dedup_db shares seen deliveries between processes
+DEDUP_SIZE = 10000
+DEDUP_TTL = 3600
+DEDUP_DB = False
+if config.has_option('web', 'dedup_size'):
+    DEDUP_SIZE = config.getint('web', 'dedup_size')
+if config.has_option('web', 'dedup_ttl'):
+    DEDUP_TTL = config.getint('web', 'dedup_ttl')
+if config.has_option('web', 'dedup_db'):
+    DEDUP_DB = config.getboolean('web', 'dedup_db')
+
+# addresses allowed to read /metrics
+metrics_allow = ["127.0.0.1", "::1"]
+if config.has_option('web', 'metrics_allow'):
+    metrics_allow = [ ip.strip() for ip in config.get('web', 'metrics_allow').split(",") if ip.strip() ]
+METRICS_ALLOW = NetworkMatcher(metrics_allow)
+
+# one JSON line is logged per webhook event. sample is the fraction of
+# events logged (failures always are), lines are cut at max_bytes and
+# full payloads are only logged with log_payloads = yes
+EVENT_LOG_SAMPLE = 1.0
+EVENT_LOG_MAX_BYTES = 4096
+EVENT_LOG_PAYLOADS = False
+if config.has_option('web', 'event_log_sample'):
+    EVENT_LOG_SAMPLE = config.getfloat('web', 'event_log_sample')
+if config.has_option('web', 'event_log_max_bytes'):
+    EVENT_LOG_MAX_BYTES = config.getint('web', 'event_log_max_bytes')
+if config.has_option('web', 'log_payloads'):
+    EVENT_LOG_PAYLOADS = config.getboolean('web', 'log_payloads')
+
+# seconds between checks whether another process changed the mappings
+ROUTE_CHECK_INTERVAL = 5
+if config.has_option('web', 'route_check_interval'):
+    ROUTE_CHECK_INTERVAL = config.getint('web', 'route_check_interval')
+
+# log the number of SQL queries and their time for every request
+QUERY_LOG = False
+if config.has_option('web', 'query_log'):
+    QUERY_LOG = config.getboolean('web', 'query_log')
+
+# on demand profiling of webhook POSTs, see ProfileMiddleware
+PROFILE = False
+PROFILE_SECRET = None
+PROFILE_REPOS = []
+PROFILE_MAX_PER_MINUTE = 6
+PROFILE_DIR = "/var/tmp/webhook_profiles"
+PROFILE_KEEP = 50
+if config.has_option('web', 'profile'):
+    PROFILE = config.getboolean('web', 'profile')
+if config.has_option('web', 'profile_secret'):
+    PROFILE_SECRET = config.get('web', 'profile_secret')
+if config.has_option('web', 'profile_repos'):
+    PROFILE_REPOS = [ repo.strip() for repo in config.get('web', 'profile_repos').split(",") if repo.strip() ]
+if config.has_option('web', 'profile_max_per_minute'):
+    PROFILE_MAX_PER_MINUTE = config.getint('web', 'profile_max_per_minute')
+if config.has_option('web', 'profile_dir'):
+    PROFILE_DIR = config.get('web', 'profile_dir')
+if config.has_option('web', 'profile_keep'):
+    PROFILE_KEEP = config.getint('web', 'profile_keep')
 
 OUTGOING_PROXY = None
+OUTGOING_PROXY_PORT = None
 if config.has_option('web', 'outgoing_proxy'):
     OUTGOING_PROXY = config.get('web', 'outgoing_proxy')
     OUTGOING_PROXY_PORT = config.get('web', 'outgoing_proxy_port')
 
+# provider API calls: seconds to connect and for the whole call
+API_CONNECT_TIMEOUT = 5
+API_TIMEOUT = 20
+if config.has_option('web', 'api_connect_timeout'):
+    API_CONNECT_TIMEOUT = config.getint('web', 'api_connect_timeout')
+if config.has_option('web', 'api_timeout'):
+    API_TIMEOUT = config.getint('web', 'api_timeout')
+
+# Asynchronous ingestion: the view spools payloads and the
+# webhook_dispatcher management command launches them
+ASYNC_DISPATCH = False
+DISPATCHER_WORKERS = 4
+DISPATCHER_POLL_INTERVAL = 1.0
+DISPATCHER_STATS_INTERVAL = 60
+DISPATCHER_STALE_AFTER = 600
+DISPATCHER_COALESCE_WINDOW = 2.0
+BUILD_QUIET_PERIOD = 0
+BATCH_BUILD_RATE = 5.0
+if config.has_section('dispatcher'):
+    if config.has_option('dispatcher', 'async'):
+        ASYNC_DISPATCH = config.getboolean('dispatcher', 'async')
+    if config.has_option('dispatcher', 'workers'):
+        DISPATCHER_WORKERS = config.getint('dispatcher', 'workers')
+    if config.has_option('dispatcher', 'poll_interval'):
+        DISPATCHER_POLL_INTERVAL = config.getfloat('dispatcher', 'poll_interval')
+    if config.has_option('dispatcher', 'stats_interval'):
+        DISPATCHER_STATS_INTERVAL = config.getint('dispatcher', 'stats_interval')
+    if config.has_option('dispatcher', 'coalesce_window'):
+        DISPATCHER_COALESCE_WINDOW = config.getfloat('dispatcher', 'coalesce_window')
+    if config.has_option('dispatcher', 'build_quiet_period'):
+        BUILD_QUIET_PERIOD = config.getint('dispatcher', 'build_quiet_period')
+    if config.has_option('dispatcher', 'stale_after'):
+        DISPATCHER_STALE_AFTER = config.getint('dispatcher', 'stale_after')
+    if config.has_option('dispatcher', 'batch_build_rate'):
+        BATCH_BUILD_RATE = config.getfloat('dispatcher', 'batch_build_rate')
+
 BOSS_HOST = config.get('boss', 'boss_host')
 BOSS_USER = config.get('boss', 'boss_user')
 BOSS_PASS = config.get('boss', 'boss_pass')
 BOSS_VHOST = config.get('boss', 'boss_vhost')
+# AMQP connections to BOSS are pooled and reused between launches
+BOSS_MAX_CONNECTIONS = 4
+BOSS_CONNECTION_MAX_IDLE = 300
+if config.has_option('boss', 'max_connections'):
+    BOSS_MAX_CONNECTIONS = config.getint('boss', 'max_connections')
+if config.has_option('boss', 'connection_max_idle'):
+    BOSS_CONNECTION_MAX_IDLE = config.getint('boss', 'connection_max_idle')
+# record launches in memory instead of sending them, for replay_webhooks
+# load tests against a live server
+BOSS_LAUNCHER_STUB = False
+if config.has_option('boss', 'launcher_stub'):
+    BOSS_LAUNCHER_STUB = config.getboolean('boss', 'launcher_stub')
 
 db_engine = config.get('db', 'db_engine')
 db_name = config.get('db', 'db_name')
@@ -90,6 +216,10 @@ db_host = config.get('db', 'db_host')
 
 VCSCOMMIT_NOTIFY = config.get('processes', 'vcscommit_notify')
 VCSCOMMIT_BUILD = config.get('processes', 'vcscommit_build')
+# per build service / project overrides are looked up under here
+PROCESS_DIR = dirname(VCSCOMMIT_NOTIFY)
+if config.has_option('processes', 'process_dir'):
+    PROCESS_DIR = config.get('processes', 'process_dir')
 
 
 USE_LDAP = config.getboolean('ldap', 'use_ldap')
@@ -196,6 +326,11 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.messages.middleware.MessageMiddleware',
 )
 
+if QUERY_LOG:
+    MIDDLEWARE_CLASSES += ( 'webhook_launcher.app.querycount.QueryCountMiddleware',)
+if PROFILE:
+    MIDDLEWARE_CLASSES += ( 'webhook_launcher.app.profiling.ProfileMiddleware',)
+
 ROOT_URLCONF = 'webhook_launcher.urls'
 
 TEMPLATE_DIRS = (
@@ -227,6 +362,35 @@ INSTALLED_APPS = (
     'django_extensions',
 )
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'event': {
+            'format': '%(asctime)s %(message)s',
+        },
+    },
+    'handlers': {
+        'events': {
+            'level': 'DEBUG',
+            'class': 'logging.StreamHandler',
+            'formatter': 'event',
+        },
+    },
+    'loggers': {
+        'webhook_launcher.events': {
+            'handlers': ['events'],
+            'level': EVENT_LOG_PAYLOADS and 'DEBUG' or 'INFO',
+            'propagate': False,
+        },
+        'webhook_launcher.queries': {
+            'handlers': ['events'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 FORCE_SCRIPT_NAME = ''
 
 LOGIN_URL='/' + URL_PREFIX + "/login/"
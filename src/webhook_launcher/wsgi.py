@@ -0,0 +1,45 @@
+# Copyright (C) 2013 Jolla Ltd.
+# Contact: Islam Amer <islam.amer@jollamobile.com>
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" WSGI entry point, eg. for gunicorn:
+
+  gunicorn -c /etc/skynet/webhook_gunicorn.py webhook_launcher.wsgi:application
+"""
+
+import os
+import sys
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webhook_launcher.settings')
+# the app is installed as 'app' and imported as such by the urls
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from django.core.wsgi import get_wsgi_application
+
+application = get_wsgi_application()
+
+def warm_up():
+    """ Fill the per process caches before the first request """
+
+    from webhook_launcher.app.startup import warm_up as _warm_up
+    _warm_up()
+
+def after_fork():
+    """ Drop connections inherited from the parent process """
+
+    from webhook_launcher.app.startup import after_fork as _after_fork
+    _after_fork()